@@ -0,0 +1,123 @@
+"""
+API diff between two git revisions (--api-diff OLD NEW).
+
+Only the .java files that changed between the revisions are summarized, old and new
+versions alike, and the type records of their declarations (see declarations.py) are
+compared by qualified name. This gives the types that were added, removed or changed,
+and for changed types their changed declaration (kind or supertypes) and the members
+that were added, removed or changed in each section; a member is changed when as many
+signatures with its name were removed as were added, e.g. a method whose parameters changed.
+Only public and protected types and members are compared (a nested type also needs its
+enclosing types to be): private and package-private ones are not API.
+"""
+import collections
+import sys
+
+API_VISIBILITY = ('public', 'protected')
+SECTIONS = [('static_fields', 'Static fields'), ('static_methods', 'Static methods'), ('fields', 'Fields'),
+            ('methods', 'Methods'), ('constructors', 'Constructors')]
+
+
+def qualified_name(record):
+    return f"{record['package']}.{record['name']}" if record['package'] else record['name']
+
+
+def declaration(record):
+    """The declaration line of a type record, e.g. "class Widget extends Base implements Runnable"."""
+    text = f"{record['kind']} {record['name'].rpartition('.')[2]}"
+    if record['extends']:
+        text += f" extends {', '.join(record['extends'])}"
+    if record['implements']:
+        text += f" implements {', '.join(record['implements'])}"
+    return text
+
+
+def member_name(signature):
+    """The name of a method, constructor or field signature."""
+    head = signature.split('(', 1)[0]
+    return head.split()[-1] if head.split() else head
+
+
+def api_members(record, section):
+    """The public and protected members of a section of a type record."""
+    return [signature for signature in record[section]
+            if record['visibility'].get(signature, 'public') in API_VISIBILITY]
+
+
+def api_types(records):
+    """
+    {qualified name: record} of the types that are part of the API: public or protected, and
+    nested only in types that are too.
+    """
+    types = {qualified_name(record): record for record in records}
+    api = {}
+    for name, record in types.items():
+        # the record itself and its enclosing types: Outer.Inner is nested in Outer
+        parts = record['name'].split('.')
+        nesting = [types.get(qualified_name(dict(record, name='.'.join(parts[:depth]))))
+                   for depth in range(1, len(parts) + 1)]
+        if all(type_record is None or type_record['type_visibility'] in API_VISIBILITY for type_record in nesting):
+            api[name] = record
+    return api
+
+
+def diff_members(section, before, after):
+    removed = list((collections.Counter(before) - collections.Counter(after)).elements())
+    added = list((collections.Counter(after) - collections.Counter(before)).elements())
+    by_name = collections.defaultdict(lambda: ([], []))
+    for signature in removed:
+        by_name[member_name(signature)][0].append(signature)
+    for signature in added:
+        by_name[member_name(signature)][1].append(signature)
+
+    changes = []
+    for name, (old, new) in by_name.items():
+        if len(old) == len(new):
+            changes.extend({'change': 'changed', 'section': section, 'old': old_signature, 'new': new_signature}
+                           for old_signature, new_signature in zip(old, new))
+            continue
+        changes.extend({'change': 'removed', 'section': section, 'old': signature} for signature in old)
+        changes.extend({'change': 'added', 'section': section, 'new': signature} for signature in new)
+    return changes
+
+
+def diff_types(old_records, new_records):
+    """
+    Compare the type records of the old and new versions of the changed files. Returns a list
+    of changes, one per type that was added, removed or changed, sorted by name:
+    {'type': name, 'change': 'added'|'removed'|'changed', 'old': declaration, 'new': declaration,
+     'members': [{'change', 'section', 'old', 'new'}]}, with only the relevant keys present.
+    """
+    old_types = api_types(old_records)
+    new_types = api_types(new_records)
+    changes = []
+    for name in sorted(old_types.keys() | new_types.keys()):
+        before, after = old_types.get(name), new_types.get(name)
+        if before is None:
+            changes.append({'type': name, 'change': 'added', 'new': declaration(after)})
+            continue
+        if after is None:
+            changes.append({'type': name, 'change': 'removed', 'old': declaration(before)})
+            continue
+        members = []
+        for section, title in SECTIONS:
+            members.extend(diff_members(title, api_members(before, section), api_members(after, section)))
+        if members or declaration(before) != declaration(after):
+            change = {'type': name, 'change': 'changed', 'members': members}
+            if declaration(before) != declaration(after):
+                change.update(old=declaration(before), new=declaration(after))
+            changes.append(change)
+    return changes
+
+
+def print_report(changes, file=sys.stdout):
+    markers = {'added': '+', 'removed': '-', 'changed': '~'}
+    for change in changes:
+        print(f"{markers[change['change']]} {change['type']}", file=file)
+        if 'old' in change and 'new' in change:
+            print(f"    {change['old']} -> {change['new']}", file=file)
+        for member in change.get('members', []):
+            signature = member['new'] if member['change'] == 'added' else member['old']
+            if member['change'] == 'changed':
+                signature = f"{member['old']} -> {member['new']}"
+            print(f"  {markers[member['change']]} {member['section']}: {signature}", file=file)
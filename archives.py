@@ -0,0 +1,71 @@
+"""
+Reading .java sources straight out of .jar/.zip archives (e.g. -sources.jar files).
+
+An entry of an archive is named "path/to/archive.jar!/com/acme/Foo.java", like a jar URL,
+and is handled everywhere else like a file path: discovery lists every entry as its own
+work item, and workers read entries through read_source, keeping a few archives open.
+An open archive is reopened when its mtime, size or inode change, so long-lived workers
+(--watch, the daemon) read a rebuilt archive rather than the one they opened first.
+"""
+import collections
+import os
+import re
+import sys
+import zipfile
+
+ARCHIVE_EXTENSIONS = ('.jar', '.zip')
+ARCHIVE_ENTRY = re.compile(r'(.*?\.(?:jar|zip))!/(.*)', re.IGNORECASE | re.DOTALL)
+MAX_OPEN_ARCHIVES = 16
+
+_open_archives = collections.OrderedDict()  # path -> (stamp, ZipFile), LRU order
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def split_archive_path(source):
+    """Return (archive path, entry name) for an archive entry, or None for a plain file."""
+    match = ARCHIVE_ENTRY.fullmatch(source)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def archive_entries(archive):
+    """Return [(entry path, size)] for the .java entries of archive, sorted by name."""
+    try:
+        with zipfile.ZipFile(archive) as z:
+            return [(f"{archive}!/{info.filename}", info.file_size)
+                    for info in sorted(z.infolist(), key=lambda info: info.filename)
+                    if not info.is_dir() and info.filename.endswith('.java')]
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"Skipping {archive}: {e}", file=sys.stderr)
+        return []
+
+
+def _open_archive(archive):
+    st = os.stat(archive)
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _open_archives.pop(archive, None)
+    if cached is not None and cached[0] != stamp:
+        cached[1].close()
+        cached = None
+    if cached is None:
+        cached = (stamp, zipfile.ZipFile(archive))
+        if len(_open_archives) >= MAX_OPEN_ARCHIVES:
+            _, (_, oldest) = _open_archives.popitem(last=False)
+            oldest.close()
+    _open_archives[archive] = cached
+    return cached[1]
+
+
+def read_source(source):
+    """Return the bytes of a file or archive entry."""
+    split = split_archive_path(source)
+    if split is None:
+        with open(source, 'rb') as f:
+            return f.read()
+    archive, entry = split
+    try:
+        return _open_archive(archive).read(entry)
+    except KeyError:
+        raise FileNotFoundError(source)
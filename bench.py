@@ -0,0 +1,339 @@
+"""
+Throughput benchmark for java_summary_antlr.
+
+Generates a reproducible synthetic Java corpus (or uses an existing source tree with
+--source) and reports files/sec, MB/sec, per-phase time and peak RSS, optionally as JSON
+so results can be tracked across grammar regenerations and runtime upgrades.
+
+    python bench.py --files 200 --statements 20 --json results.json
+    python bench.py --source path/to/java/tree --end-to-end
+    python bench.py --scaling members --sizes 1250,2500,5000,10000
+    python bench.py --scaling bodies --methods 10 --sizes 100,200,400,800
+    python bench.py --dispatch --files 2000
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from antlr4 import InputStream
+
+import java_summary_antlr
+from declarations import render_text
+from discovery import scan_tree
+
+TYPES = ['int', 'long', 'boolean', 'String', 'Object', 'byte[]', 'Integer']
+CONTAINERS = ['List', 'Set', 'Optional', 'Collection', 'Supplier']
+STATEMENTS = [
+    'int v{i} = a + b * {i} - (c << 2);',
+    'if (items != null && items.size() > {i}) {{ count += {i}; }}',
+    'for (int j = 0; j < {i}; j++) {{ total += j * 2; }}',
+    'names.stream().filter(s -> s.length() > {i}).map(String::trim).forEach(out::add);',
+    'try {{ handle({i}); }} catch (IllegalStateException | IllegalArgumentException e) {{ throw new RuntimeException("failed {i}", e); }}',
+    'Map<String, List<Integer>> m{i} = new HashMap<>();',
+    'switch (kind) {{ case {i}: first(); break; default: second(); }}',
+    'Runnable r{i} = () -> {{ System.out.println("value " + {i}); }};',
+    'String s{i} = flag ? "a" : "b" + value.toString().substring({i});',
+]
+
+
+def generic_type(rng, depth):
+    if depth <= 0:
+        return rng.choice(TYPES[3:])
+    if rng.random() < 0.3:
+        return f"Map<{generic_type(rng, depth - 1)}, {generic_type(rng, depth - 1)}>"
+    return f"{rng.choice(CONTAINERS)}<{generic_type(rng, depth - 1)}>"
+
+
+def field_type(rng, generic_depth):
+    return generic_type(rng, rng.randint(0, generic_depth)) if generic_depth else rng.choice(TYPES)
+
+
+def class_lines(rng, name, indent, args, depth):
+    pad = '    ' * indent
+    lines = [f"{pad}public {'static ' if indent else ''}class {name} implements Comparable<{name}> {{"]
+    for i in range(args.fields):
+        modifiers = rng.choice(['private', 'protected', 'public static final', 'private final'])
+        lines.append(f"{pad}    {modifiers} {field_type(rng, args.generic_depth)} field{i};")
+    for m in range(args.methods):
+        params = ', '.join(f"{field_type(rng, args.generic_depth)} p{k}" for k in range(rng.randint(0, 3)))
+        modifiers = rng.choice(['public', 'public static', 'private', 'protected', 'public synchronized'])
+        returns = rng.choice(['void', field_type(rng, args.generic_depth)])
+        lines.append(f"{pad}    {modifiers} {returns} method{m}({params}) {{")
+        for i in range(args.statements):
+            lines.append(f"{pad}        " + rng.choice(STATEMENTS).format(i=i))
+        if returns != 'void':
+            lines.append(f"{pad}        return null;")
+        lines.append(f"{pad}    }}")
+    lines.append(f"{pad}    public int compareTo({name} other) {{ return 0; }}")
+    if depth < args.nesting:
+        lines.extend(class_lines(rng, f"{name}Inner{depth + 1}", indent + 1, args, depth + 1))
+    lines.append(f"{pad}}}")
+    return lines
+
+
+def generate_corpus(directory, args):
+    """Write a synthetic corpus that depends only on args (and args.seed)."""
+    rng = random.Random(args.seed)
+    for n in range(args.files):
+        package = f"com.example.bench.p{n % args.packages}"
+        package_dir = os.path.join(directory, *package.split('.'))
+        os.makedirs(package_dir, exist_ok=True)
+        lines = [f"package {package};", "", "import java.util.*;", "import java.util.function.*;", ""]
+        lines.extend(class_lines(rng, f"Generated{n}", 0, args, 0))
+        with open(os.path.join(package_dir, f"Generated{n}.java"), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def java_files(directory):
+    return [filepath for filepath, _ in scan_tree(directory)]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(who).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def bench_phases(files, methods_only, skip_bodies):
+    """Summarize every file in this process, timing each phase."""
+    timings = {'read': 0.0, 'lex': 0.0, 'parse': 0.0, 'walk': 0.0, 'format': 0.0, 'tokens': 0}
+    total_bytes = 0
+    start = time.perf_counter()
+    for filepath in files:
+        t0 = time.perf_counter()
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        input_stream = InputStream(data.decode('utf-8'))
+        timings['read'] += time.perf_counter() - t0
+        total_bytes += len(data)
+        result = java_summary_antlr.summarize(input_stream, skip_bodies, timings)
+        t0 = time.perf_counter()
+        render_text(result.declarations, methods_only)
+        timings['format'] += time.perf_counter() - t0
+    elapsed = time.perf_counter() - start
+    tokens = timings.pop('tokens')
+    return {
+        'files': len(files),
+        'bytes': total_bytes,
+        'tokens': tokens,
+        'seconds': elapsed,
+        'files_per_sec': len(files) / elapsed if elapsed else 0.0,
+        'mb_per_sec': total_bytes / (1024 * 1024) / elapsed if elapsed else 0.0,
+        'phases': timings,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_end_to_end(directory, files, methods_only, skip_bodies):
+    """Run main() with its worker pool, discarding the output."""
+    total_bytes = sum(os.path.getsize(filepath) for filepath in files)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull:
+        java_summary_antlr.main(directory, methods_only, skip_bodies, out=devnull)
+    elapsed = time.perf_counter() - start
+    return {
+        'files': len(files),
+        'bytes': total_bytes,
+        'seconds': elapsed,
+        'files_per_sec': len(files) / elapsed if elapsed else 0.0,
+        'mb_per_sec': total_bytes / (1024 * 1024) / elapsed if elapsed else 0.0,
+        'peak_rss_mb_workers': peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def bench_scaling(args, sizes):
+    """
+    Summarize one synthetic class at each size, in this process, to check that the listener
+    (walk) and rendering (format) time per unit stays flat as the class grows. A unit is a
+    member for --scaling members (half fields, half methods without statements), and a
+    statement for --scaling bodies (--methods methods of more and more statements each).
+    """
+    results = []
+    directory = tempfile.mkdtemp(prefix='javasummary-scaling-')
+    try:
+        for size in sizes[:1] + sizes:  # the first run warms up the DFAs and isn't reported
+            scaled = argparse.Namespace(**vars(args))
+            scaled.files, scaled.packages, scaled.nesting = 1, 1, 0
+            if args.scaling == 'members':
+                scaled.fields, scaled.methods, scaled.statements = size // 2, size - size // 2, 0
+            else:
+                scaled.statements = size
+            shutil.rmtree(directory, ignore_errors=True)
+            generate_corpus(directory, scaled)
+            units = size if args.scaling == 'members' else size * scaled.methods
+            results.append(dict(bench_phases(java_files(directory), args.methods_only, args.skip_bodies),
+                                size=size, units=units))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results[1:]
+
+
+def bench_dispatch(args):
+    """
+    Time main() on many tiny files that are all cache hits, so that the time is mostly spent
+    dispatching files to the workers: once with one file per task, as when every file was
+    submitted on its own, and once with the batches of make_batches.
+    """
+    tiny = argparse.Namespace(**vars(args))
+    tiny.fields, tiny.methods, tiny.statements, tiny.nesting = 1, 1, 0, 0
+    directory = tempfile.mkdtemp(prefix='javasummary-dispatch-')
+    make_batches = java_summary_antlr.make_batches
+    results = {}
+    try:
+        generate_corpus(directory, tiny)
+        cache_dir = os.path.join(directory, 'cache')
+        files = java_files(directory)
+        per_file = lambda sized_files: make_batches(sized_files, max_batch_files=1)
+        modes = [('warm-up', make_batches), ('per file', per_file), ('batched', make_batches)]
+        with open(os.devnull, 'w') as devnull:
+            for mode, batches in modes:
+                java_summary_antlr.make_batches = batches
+                start = time.perf_counter()
+                java_summary_antlr.main(directory, args.methods_only, args.skip_bodies, cache_dir=cache_dir,
+                                        out=devnull)
+                results[mode] = time.perf_counter() - start
+    finally:
+        java_summary_antlr.make_batches = make_batches
+        shutil.rmtree(directory, ignore_errors=True)
+    del results['warm-up']  # fills the cache
+    return {'files': len(files), 'seconds': results}
+
+
+SCALING_UNITS = {'members': 'member', 'bodies': 'statement'}
+
+
+def print_scaling(kind, results, file=sys.stderr):
+    unit = SCALING_UNITS[kind]
+    print(f"Scaling with {kind}:", file=file)
+    print(f"  {unit + 's':>10}{'bytes':>11}{'parse':>10}{'walk':>10}{'format':>10}  walk+format per {unit}", file=file)
+    for result in results:
+        phases = result['phases']
+        listener = phases['walk'] + phases['format']
+        print(f"  {result['units']:>10}{result['bytes']:>11}{phases['parse']:>9.4f}s{phases['walk']:>9.4f}s"
+              f"{phases['format']:>9.4f}s  {listener / result['units'] * 1e6:8.2f} us", file=file)
+
+
+def print_report(report, file=sys.stderr):
+    corpus = report['corpus']
+    print(f"Corpus: {corpus['files']} files, {corpus['bytes'] / (1024 * 1024):.2f} MB ({corpus['source']})", file=file)
+    phases = report['in_process']
+    print(f"In-process: {phases['seconds']:.2f}s, {phases['tokens']} tokens, {phases['files_per_sec']:.1f} files/s, "
+          f"{phases['mb_per_sec']:.3f} MB/s, peak RSS {phases['peak_rss_mb']:.0f} MB", file=file)
+    for phase, seconds in phases['phases'].items():
+        share = seconds / phases['seconds'] * 100 if phases['seconds'] else 0.0
+        print(f"  {phase:<7}{seconds:9.3f}s {share:5.1f}%", file=file)
+    if 'end_to_end' in report:
+        e2e = report['end_to_end']
+        print(f"End-to-end: {e2e['seconds']:.2f}s, {e2e['files_per_sec']:.1f} files/s, "
+              f"{e2e['mb_per_sec']:.3f} MB/s, peak worker RSS {e2e['peak_rss_mb_workers']:.0f} MB", file=file)
+
+
+def write_json(report, path):
+    if path == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif path:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark java_summary_antlr on a synthetic or real Java corpus.')
+    parser.add_argument('--source', metavar='DIR', help='Benchmark an existing source tree instead of a synthetic corpus')
+    parser.add_argument('--corpus-dir', metavar='DIR', help='Write the synthetic corpus to DIR and keep it')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--files', type=int, default=100, help='Number of synthetic files')
+    parser.add_argument('--packages', type=int, default=10, help='Number of packages to spread files over')
+    parser.add_argument('--fields', type=int, default=5, help='Fields per class')
+    parser.add_argument('--methods', type=int, default=10, help='Methods per class')
+    parser.add_argument('--statements', type=int, default=10, help='Statements per method body')
+    parser.add_argument('--nesting', type=int, default=1, help='Depth of nested classes')
+    parser.add_argument('--generic-depth', type=int, default=2, help='Maximum nesting of generic type arguments')
+    parser.add_argument('--methods-only', action='store_true')
+    parser.add_argument('--skip-bodies', action='store_true')
+    parser.add_argument('--end-to-end', action='store_true', help='Also time main() with its worker pool')
+    parser.add_argument('--scaling', choices=['members', 'bodies'],
+                        help='Instead of a corpus, summarize a single class at each of --sizes: with more and '
+                             'more members, or with --methods methods of more and more statements each')
+    parser.add_argument('--sizes', default='1250,2500,5000,10000',
+                        help='Comma-separated sizes for --scaling (default: %(default)s)')
+    parser.add_argument('--dispatch', action='store_true',
+                        help='Instead of a corpus, time main() on --files tiny cached files, dispatched one '
+                             'file per task and in batches')
+    parser.add_argument('--json', metavar='FILE', help="Write results as JSON to FILE ('-' for stdout)")
+    args = parser.parse_args()
+
+    if args.scaling:
+        sizes = [int(size) for size in args.sizes.split(',')]
+        report = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scaling': args.scaling,
+            'results': bench_scaling(args, sizes),
+        }
+        print_scaling(args.scaling, report['results'])
+        write_json(report, args.json)
+        return
+
+    if args.dispatch:
+        report = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'dispatch': bench_dispatch(args),
+        }
+        dispatch = report['dispatch']
+        print(f"Dispatch of {dispatch['files']} cached files:", file=sys.stderr)
+        for mode, seconds in dispatch['seconds'].items():
+            print(f"  {mode:<9}{seconds:8.2f}s {dispatch['files'] / seconds:9.0f} files/s", file=sys.stderr)
+        write_json(report, args.json)
+        return
+
+    temp_dir = None
+    if args.source:
+        directory = args.source
+        source = args.source
+    else:
+        directory = args.corpus_dir or tempfile.mkdtemp(prefix='javasummary-bench-')
+        temp_dir = None if args.corpus_dir else directory
+        generate_corpus(directory, args)
+        source = 'synthetic'
+
+    try:
+        files = java_files(directory)
+        # run the pool first: forked workers would otherwise inherit DFAs warmed by bench_phases
+        end_to_end = bench_end_to_end(directory, files, args.methods_only, args.skip_bodies) if args.end_to_end else None
+        report = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'options': {'methods_only': args.methods_only, 'skip_bodies': args.skip_bodies},
+            'corpus': {'source': source, 'files': len(files), 'bytes': sum(os.path.getsize(f) for f in files)},
+            'in_process': bench_phases(files, args.methods_only, args.skip_bodies),
+        }
+        if not args.source:
+            report['corpus']['parameters'] = {name: getattr(args, name) for name in (
+                'seed', 'files', 'packages', 'fields', 'methods', 'statements', 'nesting', 'generic_depth')}
+        if end_to_end is not None:
+            report['end_to_end'] = end_to_end
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print_report(report)
+    write_json(report, args.json)
+
+
+if __name__ == '__main__':
+    main()
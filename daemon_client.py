@@ -0,0 +1,73 @@
+"""
+Thin command line client of the summary daemon (see summary_daemon.py).
+
+Takes the same arguments as java_summary_antlr.py and forwards them to the daemon over its
+Unix socket, so that a summary costs a connection instead of starting Python, importing the
+parser, deserializing the ATN and warming up a new process pool. This module only imports the
+standard library; if no daemon is running, or it can't serve the request (e.g. --watch or
+--stats), the command runs in this process exactly like java_summary_antlr.py.
+
+Replies are frames of a one-byte kind, a 4-byte big-endian length and a payload: stdout and
+stderr output, the exit status, or a request to fall back to running in-process.
+"""
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+FRAME_HEADER = struct.Struct('>cI')
+STDOUT = b'o'
+STDERR = b'e'
+EXIT = b'x'
+FALLBACK = b'f'
+
+
+def socket_path():
+    return os.environ.get('JAVA_SUMMARY_SOCKET') or os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), f"java-summary-{os.getuid()}.sock")
+
+
+def send_frame(connection, kind, payload):
+    connection.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def request(argv, path=None):
+    """Run argv in the daemon. Returns the exit status, or None if it has to run in-process instead."""
+    try:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path or socket_path())
+    except OSError:
+        return None
+    with connection:
+        connection.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode() + b'\n')
+        reader = connection.makefile('rb')
+        started = False
+        while True:
+            header = reader.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                if not started:
+                    return None
+                print('daemon_client.py: the daemon exited during the request', file=sys.stderr)
+                return 1
+            kind, length = FRAME_HEADER.unpack(header)
+            payload = reader.read(length)
+            if kind == FALLBACK:
+                return None
+            if kind == EXIT:
+                return int(payload)
+            started = True
+            stream = sys.stdout if kind == STDOUT else sys.stderr
+            stream.buffer.write(payload)
+            stream.flush()
+
+
+if __name__ == '__main__':
+    status = request(sys.argv[1:])
+    if status is None:
+        import java_summary_antlr
+        parser = java_summary_antlr.build_parser()
+        java_summary_antlr.run(parser.parse_args(sys.argv[1:]), parser)
+        status = 0
+    sys.exit(status)
@@ -0,0 +1,136 @@
+"""
+Per-decision profiling of JavaParser's adaptive prediction (--decision-profile).
+
+ProfilingParserATNSimulator counts, for every grammar decision, how often it is predicted,
+the time spent, the lookahead depth, DFA hits vs. ATN simulation steps in SLL mode, and
+how often and how deeply it falls back to full-context LL prediction, in the manner of
+the Java runtime's ProfilingATNSimulator (which the Python runtime lacks).
+
+Workers accumulate into one table per process and write it to
+PREFIX.worker-<pid>.json when they exit; the parent merges them into a single report.
+"""
+import json
+import os
+import sys
+import time
+
+from antlr4 import ParserATNSimulator
+
+from JavaParser import JavaParser
+from worker_files import on_worker_exit, worker_file, worker_files
+
+COUNTERS = ['invocations', 'time', 'sll_lookahead', 'sll_max_lookahead', 'dfa_hits', 'atn_transitions',
+            'll_fallbacks', 'll_lookahead', 'll_max_lookahead', 'll_atn_transitions']
+
+_decisions = None
+
+
+def _new_table():
+    return [dict.fromkeys(COUNTERS, 0) for _ in JavaParser.atn.decisionToState]
+
+
+class ProfilingParserATNSimulator(ParserATNSimulator):
+    def __init__(self, parser, atn, decisionToDFA, sharedContextCache, decisions):
+        super().__init__(parser, atn, decisionToDFA, sharedContextCache)
+        self.decisions = decisions
+        self._currentDecision = None
+        self._sllStopIndex = -1
+        self._llStopIndex = -1
+
+    def adaptivePredict(self, input, decision, outerContext):
+        self._currentDecision = decision
+        self._sllStopIndex = -1
+        self._llStopIndex = -1
+        start = time.perf_counter()
+        startIndex = input.index
+        try:
+            return super().adaptivePredict(input, decision, outerContext)
+        finally:
+            stats = self.decisions[decision]
+            stats['invocations'] += 1
+            stats['time'] += time.perf_counter() - start
+            sll_lookahead = self._sllStopIndex - startIndex + 1
+            stats['sll_lookahead'] += sll_lookahead
+            stats['sll_max_lookahead'] = max(stats['sll_max_lookahead'], sll_lookahead)
+            if self._llStopIndex >= 0:
+                ll_lookahead = self._llStopIndex - startIndex + 1
+                stats['ll_lookahead'] += ll_lookahead
+                stats['ll_max_lookahead'] = max(stats['ll_max_lookahead'], ll_lookahead)
+            self._currentDecision = None
+
+    def getExistingTargetState(self, previousD, t):
+        self._sllStopIndex = self._input.index
+        existing = super().getExistingTargetState(previousD, t)
+        if existing is not None:
+            self.decisions[self._currentDecision]['dfa_hits'] += 1
+        return existing
+
+    def computeTargetState(self, dfa, previousD, t):
+        self.decisions[self._currentDecision]['atn_transitions'] += 1
+        return super().computeTargetState(dfa, previousD, t)
+
+    def execATNWithFullContext(self, dfa, D, s0, input, startIndex, outerContext):
+        self.decisions[self._currentDecision]['ll_fallbacks'] += 1
+        return super().execATNWithFullContext(dfa, D, s0, input, startIndex, outerContext)
+
+    def computeReachSet(self, closure, t, fullCtx):
+        if fullCtx and self._currentDecision is not None:
+            self._llStopIndex = self._input.index
+            self.decisions[self._currentDecision]['ll_atn_transitions'] += 1
+        return super().computeReachSet(closure, t, fullCtx)
+
+
+def start_worker_decision_profiling(prefix):
+    global _decisions
+    _decisions = _new_table()
+    on_worker_exit(save_worker_decisions, prefix)
+
+
+def instrument(parser):
+    """Give parser a profiling ATN simulator if this worker profiles decisions."""
+    if _decisions is not None:
+        parser._interp = ProfilingParserATNSimulator(parser, parser.atn, parser.decisionsToDFA,
+                                                     parser.sharedContextCache, _decisions)
+
+
+def save_worker_decisions(prefix):
+    with open(worker_file(prefix, '.json'), 'w') as f:
+        json.dump(_decisions, f)
+
+
+def merge_worker_decisions(prefix):
+    """Merge and remove the per-worker tables, and write the report to PREFIX.json."""
+    merged = _new_table()
+    paths = worker_files(prefix, '.json')
+    for path in paths:
+        with open(path) as f:
+            for total, stats in zip(merged, json.load(f)):
+                for counter, value in stats.items():
+                    if counter.endswith('max_lookahead'):
+                        total[counter] = max(total[counter], value)
+                    else:
+                        total[counter] += value
+        os.remove(path)
+
+    report = []
+    for decision, stats in enumerate(merged):
+        if not stats['invocations']:
+            continue
+        state = JavaParser.atn.decisionToState[decision]
+        report.append(dict(decision=decision, rule=JavaParser.ruleNames[state.ruleIndex],
+                           atn_state=state.stateNumber, **stats))
+    report.sort(key=lambda stats: stats['time'], reverse=True)
+    with open(f"{prefix}.json", 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_report(report, top=20, file=sys.stderr):
+    print(f"Top {min(top, len(report))} of {len(report)} decisions by prediction time:", file=file)
+    print(f"  {'decision':>8} {'rule':<32}{'calls':>9}{'time':>9}{'avg LA':>8}{'max LA':>8}"
+          f"{'DFA hits':>10}{'ATN':>8}{'LL':>7}{'LL max LA':>10}", file=file)
+    for stats in report[:top]:
+        print(f"  {stats['decision']:>8} {stats['rule']:<32}{stats['invocations']:>9}{stats['time']:>8.3f}s"
+              f"{stats['sll_lookahead'] / stats['invocations']:>8.2f}{stats['sll_max_lookahead']:>8}"
+              f"{stats['dfa_hits']:>10}{stats['atn_transitions']:>8}{stats['ll_fallbacks']:>7}"
+              f"{stats['ll_max_lookahead']:>10}", file=file)
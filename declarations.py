@@ -0,0 +1,130 @@
+"""
+The declarations extracted from a file by JavaSummaryListener, and the renderers that turn
+them into output.
+
+A file is parsed once into FileDeclarations; the text summary (full or methods-only) and
+the JSON records are all rendered from it, so one run can write several of them (--write).
+
+FileDeclarations holds two views of the file. `types` has one record per type with its
+own members (see type_record), for the JSON output and the API diff. `outline` replays the
+text summary: (indentation, "Class ..." header, None) when a class starts and
+(indentation, None, counts) when it ends, where counts are how many of static_fields,
+static_methods, fields and methods the text lists at that point. These four lists are
+shared by all the classes of the file, as they always have been in the text summary.
+"""
+import json
+from collections import namedtuple
+
+FileDeclarations = namedtuple('FileDeclarations', ['package_name', 'types', 'outline', 'static_fields',
+                                                   'static_methods', 'fields', 'methods'])
+
+TEXT_SECTIONS = [('Static fields', 'static_fields', True), ('Static methods', 'static_methods', False),
+                 ('Fields', 'fields', True), ('Methods', 'methods', False)]
+TYPE_SECTIONS = TEXT_SECTIONS[:3] + [('Constructors', 'constructors', False)] + TEXT_SECTIONS[3:]
+VISIBILITY_PREFIXES = {'public': '', 'protected': 'protected ', 'package': 'package-private ', 'private': 'private '}
+
+
+def type_record(package_name, name, kind, extends=(), implements=(), type_visibility='public'):
+    """
+    The declarations of a type: its package, name (qualified by its enclosing types), kind
+    (class, interface, enum or record), declared visibility ('public', 'protected', 'package'
+    or 'private'), supertypes and member signatures. Members of every visibility are listed;
+    'visibility' maps the signatures of those that aren't public to their visibility.
+    """
+    return {'package': package_name, 'name': name, 'kind': kind, 'type_visibility': type_visibility,
+            'extends': list(extends), 'implements': list(implements), 'fields': [], 'static_fields': [],
+            'methods': [], 'static_methods': [], 'constructors': [], 'visibility': {}}
+
+
+def without_fields(record):
+    """A copy of a type record without its fields, for --methods-only."""
+    fields = set(record['fields']) | set(record['static_fields'])
+    record = {key: value for key, value in record.items() if key not in ('fields', 'static_fields')}
+    record['visibility'] = {signature: visibility for signature, visibility in record['visibility'].items()
+                            if signature not in fields}
+    return record
+
+
+def render_text(declarations, methods_only=False):
+    """The text summary of a file, without its package header."""
+    lines = []
+    for indentation, header, counts in declarations.outline:
+        indent = '  ' * indentation
+        if header is not None:
+            lines.append(f"{indent}{header}\n")
+            continue
+        for (title, section, is_field), count in zip(TEXT_SECTIONS, counts):
+            if not count or (methods_only and is_field):
+                continue
+            lines.append(f"{indent}{title}:\n")
+            lines.extend(f"{indent}  {member}\n" for member in getattr(declarations, section)[:count])
+    return ''.join(lines)
+
+
+def render_type(record, methods_only=False):
+    """
+    The text of a type record: its declaration and its own members, like a class in the text
+    summary, with the members that aren't public prefixed by their visibility.
+    """
+    extends = f" extends {', '.join(record['extends'])}" if record['extends'] else ''
+    implements = f" implements {', '.join(record['implements'])}" if record['implements'] else ''
+    lines = [f"{record['kind'].capitalize()} {record['name']}{extends}{implements}:\n"]
+    for title, section, is_field in TYPE_SECTIONS:
+        if record[section] and not (methods_only and is_field):
+            lines.append(f"  {title}:\n")
+            lines.extend(f"    {VISIBILITY_PREFIXES[record['visibility'].get(member, 'public')]}{member}\n"
+                         for member in record[section])
+    return ''.join(lines)
+
+
+class TextRenderer:
+    def __init__(self, out, methods_only=False):
+        self.out = out
+        self.methods_only = methods_only
+        self.printed_packages = set()
+
+    def write(self, source, declarations):
+        """Write the summary of a file, preceded by a package header the first time its package is seen."""
+        description = render_text(declarations, self.methods_only)
+        package_name = declarations.package_name
+        if package_name is not None and package_name not in self.printed_packages:
+            self.printed_packages.add(package_name)
+            description = f"# Package {package_name}\n" + description
+        print(description, file=self.out)
+
+    def close(self):
+        pass
+
+
+class JsonRenderer:
+    """Writes the type records of each file, with their source file, as a JSON array or as NDJSON."""
+    def __init__(self, out, methods_only=False, lines=False):
+        self.out = out
+        self.methods_only = methods_only
+        self.lines = lines
+        self.separator = '[\n'
+
+    def write(self, source, declarations):
+        for record in declarations.types:
+            record = dict(record, source=source)
+            if self.methods_only:
+                record = without_fields(record)
+            if self.lines:
+                self.out.write(json.dumps(record) + '\n')
+            else:
+                self.out.write(self.separator + json.dumps(record))
+                self.separator = ',\n'
+
+    def close(self):
+        if not self.lines:
+            self.out.write('[\n]\n' if self.separator == '[\n' else '\n]\n')
+
+
+RENDERERS = ['text', 'methods-only', 'json', 'ndjson']
+
+
+def make_renderer(name, out, methods_only=False):
+    """A renderer for one of RENDERERS ('methods-only' is text with methods_only)."""
+    if name in ('text', 'methods-only'):
+        return TextRenderer(out, methods_only or name == 'methods-only')
+    return JsonRenderer(out, methods_only, lines=name == 'ndjson')
@@ -0,0 +1,183 @@
+"""
+Persistent cache of the warmed JavaLexer/JavaParser DFAs.
+
+ANTLR builds its prediction DFAs lazily, so every fresh process (each
+ProcessPoolExecutor worker, every CLI invocation) starts out running the slow
+ATN simulation for every decision. This module pickles the DFA states built
+during a run and loads them back before parsing.
+
+ATN states and the runtime's singleton contexts are stored by reference, and
+objects whose cached hash codes depend on the per-process string hash seed are
+rebuilt through their constructors on load so the hashes are recomputed.
+"""
+import hashlib
+import io
+import os
+import pickle
+
+from antlr4 import DFA
+from antlr4.PredictionContext import (PredictionContext, SingletonPredictionContext,
+                                      ArrayPredictionContext)
+from antlr4.atn.ATNConfigSet import ATNConfigSet
+from antlr4.atn.ATNState import ATNState
+from antlr4.atn.LexerActionExecutor import LexerActionExecutor
+from antlr4.atn.SemanticContext import SemanticContext
+
+from JavaLexer import JavaLexer, serializedATN as lexer_serialized_atn
+from JavaParser import JavaParser, serializedATN as parser_serialized_atn
+from worker_files import worker_file, worker_files
+
+CACHE_FORMAT = 1
+
+
+def grammar_fingerprint():
+    h = hashlib.sha256()
+    h.update(repr((CACHE_FORMAT, pickle.HIGHEST_PROTOCOL)).encode())
+    h.update(repr(lexer_serialized_atn()).encode())
+    h.update(repr(parser_serialized_atn()).encode())
+    return h.hexdigest()
+
+
+def _restore_dfa(atnStartState, decision, states, s0, precedenceDfa):
+    dfa = DFA.__new__(DFA)
+    dfa.atnStartState = atnStartState
+    dfa.decision = decision
+    dfa._states = {state: state for state in states}
+    dfa.s0 = s0
+    dfa.precedenceDfa = precedenceDfa
+    return dfa
+
+
+def _restore_config_set(cls, state):
+    configs = cls.__new__(cls)
+    for name, value in state.items():
+        setattr(configs, name, value)
+    configs.cachedHashCode = -1
+    return configs
+
+
+class _DFAPickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        if isinstance(obj, ATNState):
+            return ('state', obj.stateNumber)
+        if obj is PredictionContext.EMPTY:
+            return ('empty',)
+        if obj is SemanticContext.NONE:
+            return ('none',)
+        return None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, DFA):
+            return _restore_dfa, (obj.atnStartState, obj.decision, list(obj._states),
+                                  obj.s0, obj.precedenceDfa)
+        if isinstance(obj, ATNConfigSet):
+            state = {name: getattr(obj, name) for name in ATNConfigSet.__slots__
+                     if name != 'cachedHashCode'}
+            return _restore_config_set, (type(obj), state)
+        if isinstance(obj, ArrayPredictionContext):
+            return ArrayPredictionContext, (obj.parents, obj.returnStates)
+        if isinstance(obj, SingletonPredictionContext):
+            return SingletonPredictionContext.create, (obj.parentCtx, obj.returnState)
+        if isinstance(obj, LexerActionExecutor):
+            return LexerActionExecutor, (obj.lexerActions,)
+        return NotImplemented
+
+
+class _DFAUnpickler(pickle.Unpickler):
+    def __init__(self, file, atn):
+        super().__init__(file)
+        self.atn = atn
+
+    def persistent_load(self, pid):
+        if pid[0] == 'state':
+            return self.atn.states[pid[1]]
+        if pid[0] == 'empty':
+            return PredictionContext.EMPTY
+        if pid[0] == 'none':
+            return SemanticContext.NONE
+        raise pickle.UnpicklingError(f"unknown persistent id {pid}")
+
+
+def _dump_dfas(dfas):
+    buf = io.BytesIO()
+    _DFAPickler(buf, pickle.HIGHEST_PROTOCOL).dump(dfas)
+    return buf.getvalue()
+
+
+def _load_dfas(data, atn):
+    return _DFAUnpickler(io.BytesIO(data), atn).load()
+
+
+def dfa_state_count():
+    return sum(len(dfa._states) for dfa in JavaLexer.decisionsToDFA + JavaParser.decisionsToDFA)
+
+
+def save_dfa_cache(path):
+    """Write the DFAs of the current process to path, atomically."""
+    payload = {
+        'fingerprint': grammar_fingerprint(),
+        'states': dfa_state_count(),
+        'lexer': _dump_dfas(JavaLexer.decisionsToDFA),
+        'parser': _dump_dfas(JavaParser.decisionsToDFA),
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(payload, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_cache_state_count(path):
+    """Number of DFA states stored in the cache at path, or -1 if it is missing or stale."""
+    try:
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return -1
+    if payload.get('fingerprint') != grammar_fingerprint():
+        return -1
+    return payload['states']
+
+
+def save_worker_snapshot(path, loaded_states):
+    """Called when a worker exits: keep its DFAs next to the cache if it learned anything."""
+    if dfa_state_count() > loaded_states:
+        save_dfa_cache(worker_file(path))
+
+
+def collect_worker_snapshots(path):
+    """
+    Replace the cache at path with the largest worker snapshot, if it is larger than what
+    is already there, and remove the snapshots. Returns the number of states in the cache.
+    """
+    best_path, best_states = path, read_cache_state_count(path)
+    snapshots = [snapshot for snapshot in worker_files(path) if not snapshot.endswith('.tmp')]
+    for snapshot in snapshots:
+        states = read_cache_state_count(snapshot)
+        if states > best_states:
+            best_path, best_states = snapshot, states
+    if best_path != path:
+        os.replace(best_path, path)
+    for snapshot in snapshots:
+        if snapshot != best_path:
+            os.remove(snapshot)
+    return best_states
+
+
+def load_dfa_cache(path):
+    """
+    Replace the (class-level, shared) lexer and parser DFAs with the ones stored at path.
+    Returns False if there is no usable cache.
+    """
+    try:
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+        if payload.get('fingerprint') != grammar_fingerprint():
+            return False
+        lexer_dfas = _load_dfas(payload['lexer'], JavaLexer.atn)
+        parser_dfas = _load_dfas(payload['parser'], JavaParser.atn)
+    except (OSError, pickle.UnpicklingError, EOFError, IndexError):
+        return False
+    # update in place: simulators created earlier hold a reference to these lists
+    JavaLexer.decisionsToDFA[:] = lexer_dfas
+    JavaParser.decisionsToDFA[:] = parser_dfas
+    return True
@@ -0,0 +1,300 @@
+"""
+Discovery of the .java files to summarize.
+
+scan_tree walks a directory tree with os.scandir on a pool of threads, so that on slow
+(e.g. network-mounted) file systems many directories are read concurrently, and yields
+files as soon as they are found so that parsing can start immediately. Files are still
+yielded in a deterministic order: the same depth-first, sorted order as
+os.walk with sorted directories.
+
+git_files lists the .java files of a git work tree from its index instead of walking
+the file system, so build output, generated sources and anything else that isn't
+tracked are never visited. Untracked files that are not ignored are added by asking git
+(which applies .gitignore and the other exclude rules).
+
+With rev, the files are the .java blobs of that revision instead (see git_objects.py).
+
+With include_archives, .jar/.zip files found by either are expanded into their .java
+entries (see archives.py).
+"""
+import concurrent.futures
+import os
+import re
+import struct
+import subprocess
+
+from archives import is_archive, archive_entries, split_archive_path
+from git_objects import GitError, tree_blobs, split_blob_path
+
+DEFAULT_THREADS = 8
+OBJECT_FORMAT = re.compile(r'^\s*objectformat\s*=\s*"?(\w+)', re.IGNORECASE | re.MULTILINE)
+
+
+def _scan_directory(pool, path, prune, include_archives):
+    """
+    List one directory and schedule the scans of its subdirectories right away.
+    Returns (subdirectory scan futures, [(path, size) of .java files]), both sorted by name.
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return [], []
+
+    subdirectories = []
+    files = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            # like os.walk, list symlinked directories but don't descend into them
+            if not entry.is_symlink() and not (prune and prune(entry.path)):
+                subdirectories.append(entry.path)
+        elif entry.name.endswith('.java'):
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                size = 0
+            files.append((entry.path, size))
+        elif include_archives and is_archive(entry.name):
+            files.extend(archive_entries(entry.path))
+
+    try:
+        futures = [pool.submit(_scan_directory, pool, subdirectory, prune, include_archives)
+                   for subdirectory in subdirectories]
+    except RuntimeError:  # the pool was shut down because the consumer stopped early
+        futures = []
+    return futures, files
+
+
+class UnsupportedIndex(Exception):
+    pass
+
+
+def find_git_dir(directory):
+    """Return (work tree root, git dir) of the repository containing directory, or None."""
+    path = os.path.abspath(directory)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return path, dot_git
+        if os.path.isfile(dot_git):
+            # worktrees and submodules: ".git" is a file pointing at the real git dir
+            with open(dot_git, encoding='utf-8') as f:
+                line = f.readline().strip()
+            if line.startswith('gitdir:'):
+                return path, os.path.join(path, line[len('gitdir:'):].strip())
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def repository_prefix(directory):
+    """Return (work tree root, git dir, path of directory relative to the root + '/'), or None."""
+    repository = find_git_dir(directory)
+    if repository is None:
+        return None
+    root, git_dir = repository
+    prefix = os.path.relpath(os.path.abspath(directory), root).replace(os.sep, '/')
+    return root, git_dir, '' if prefix == '.' else prefix + '/'
+
+
+def object_format(git_dir):
+    """The hash algorithm of the repository of git_dir, from extensions.objectFormat in its config."""
+    common_dir = git_dir
+    if os.path.isfile(os.path.join(git_dir, 'commondir')):
+        # worktrees: the config is in the main git dir
+        with open(os.path.join(git_dir, 'commondir'), encoding='utf-8') as f:
+            common_dir = os.path.join(git_dir, f.read().strip())
+    try:
+        with open(os.path.join(common_dir, 'config'), encoding='utf-8', errors='replace') as f:
+            config = f.read()
+    except OSError:
+        return 'sha1'
+    match = OBJECT_FORMAT.search(config)
+    return match.group(1).lower() if match else 'sha1'
+
+
+def read_git_index(git_dir):
+    """
+    Parse the index file of git_dir (versions 2-4) and return a list of (path, size) of the
+    stage-0 or first-stage entries that are regular files or symlinks present in the work tree.
+    Raises UnsupportedIndex for split or sparse indexes, and for repositories that don't use
+    SHA-1 object ids (the entry layout below assumes 20-byte ids).
+    """
+    if object_format(git_dir) != 'sha1':
+        raise UnsupportedIndex(f'object format {object_format(git_dir)}')
+    with open(os.path.join(git_dir, 'index'), 'rb') as f:
+        data = f.read()
+    if data[:4] != b'DIRC':
+        raise UnsupportedIndex('not an index file')
+    version, count = struct.unpack('>II', data[4:12])
+    if version not in (2, 3, 4):
+        raise UnsupportedIndex(f'index version {version}')
+
+    entries = []
+    offset = 12
+    previous_path = b''
+    last_path = None
+    for _ in range(count):
+        mode, size = struct.unpack('>I8xI', data[offset + 24:offset + 40])
+        flags, = struct.unpack('>H', data[offset + 60:offset + 62])
+        header_end = offset + 62
+        skip_worktree = False
+        if flags & 0x4000:  # extended flags (version 3+)
+            extended, = struct.unpack('>H', data[header_end:header_end + 2])
+            skip_worktree = bool(extended & 0x4000)
+            header_end += 2
+
+        if version == 4:
+            # path is prefix-compressed against the previous entry's path
+            byte = data[header_end]
+            strip = byte & 0x7f
+            varint_end = header_end + 1
+            while byte & 0x80:
+                byte = data[varint_end]
+                strip = ((strip + 1) << 7) | (byte & 0x7f)
+                varint_end += 1
+            path_end = data.index(b'\0', varint_end)
+            path = previous_path[:len(previous_path) - strip] + data[varint_end:path_end]
+            offset = path_end + 1
+        else:
+            path_end = data.index(b'\0', header_end)
+            path = data[header_end:path_end]
+            # entries are NUL-padded to a multiple of 8 bytes
+            offset += (path_end - offset + 8) & ~7
+        previous_path = path
+
+        object_type = mode >> 12
+        if object_type == 0o04:
+            raise UnsupportedIndex('sparse index')
+        if object_type in (0o10, 0o12) and not skip_worktree and path != last_path:
+            entries.append((path.decode('utf-8', 'surrogateescape'), size))
+        last_path = path
+
+    # extensions follow the entries, up to the trailing checksum
+    while offset + 8 <= len(data) - 20:
+        signature = data[offset:offset + 4]
+        extension_size, = struct.unpack('>I', data[offset + 4:offset + 8])
+        if signature == b'link':
+            raise UnsupportedIndex('split index')
+        offset += 8 + extension_size
+    return entries
+
+
+def _git_ls_files(root, prefix, *options):
+    output = subprocess.run(['git', '-C', root, 'ls-files', '-z', *options, '--', prefix or '.'],
+                            check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return [path.decode('utf-8', 'surrogateescape') for path in output.split(b'\0') if path]
+
+
+def git_files(directory, include_archives=False):
+    """
+    Yield (path, size) for the tracked and untracked-but-not-ignored .java files under
+    directory, or return None if directory is not inside a git work tree.
+    """
+    repository = repository_prefix(directory)
+    if repository is None:
+        return None
+    root, git_dir, prefix = repository
+
+    try:
+        tracked = read_git_index(git_dir)
+    except FileNotFoundError:
+        tracked = []  # no commits or nothing staged yet
+    except (UnsupportedIndex, struct.error, ValueError, IndexError):
+        tracked = None
+
+    try:
+        if tracked is None:
+            tracked = [(path, -1) for path in _git_ls_files(root, prefix, '--cached')]
+        untracked = _git_ls_files(root, prefix, '--others', '--exclude-standard')
+    except (OSError, subprocess.CalledProcessError):
+        if tracked is None:
+            return None
+        untracked = []  # git isn't available: tracked files only
+
+    def relative_files():
+        for path, size in tracked:
+            yield path, size
+        for path in untracked:
+            yield path, -1
+
+    def generate():
+        for path, size in sorted(relative_files()):
+            if not path.startswith(prefix):
+                continue
+            filepath = os.path.join(directory, *path[len(prefix):].split('/'))
+            if include_archives and is_archive(path):
+                yield from archive_entries(filepath)
+            elif path.endswith('.java'):
+                if size < 0:
+                    try:
+                        size = os.path.getsize(filepath)
+                    except OSError:
+                        size = 0
+                yield filepath, size
+    return generate()
+
+
+def scan_tree(directory, threads=DEFAULT_THREADS, prune=None, include_archives=False):
+    """
+    Yield (path, size) for every .java file under directory, in sorted depth-first order.
+    Subdirectories for which prune(path) is true are skipped.
+    """
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='discovery')
+    try:
+        stack = [pool.submit(_scan_directory, pool, directory, prune, include_archives)]
+        while stack:
+            subdirectories, files = stack.pop().result()
+            yield from files
+            stack.extend(reversed(subdirectories))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def discover(directory, threads=DEFAULT_THREADS, use_git=False, source_filter=None, include_archives=False,
+             rev=None):
+    """
+    Yield (path, size) of the .java files to summarize under directory (or in the archive
+    directory, or under directory in revision rev), leaving out the ones that source_filter
+    excludes by path. Raises GitError if rev is given and can't be listed.
+    """
+    files = None
+    if rev is not None:
+        repository = repository_prefix(directory)
+        if repository is None:
+            raise GitError(f"{directory} is not inside a git repository")
+        root, _, prefix = repository
+        files = iter(tree_blobs(root, prefix, rev))
+    elif os.path.isfile(directory) and is_archive(directory):
+        files = iter(archive_entries(directory))
+    elif use_git:
+        files = git_files(directory, include_archives)
+    if files is None:
+        prune = None
+        if source_filter is not None and source_filter.pruned_directories:
+            prune = lambda path: source_filter.prunes_directory(source_filter.relative_path(path))
+        files = scan_tree(directory, threads, prune, include_archives)
+    if source_filter is None:
+        return files
+    return ((path, size) for path, size in files if source_filter.allows_path(source_filter.relative_path(path)))
+
+
+def file_stamp(filepath):
+    """
+    What has to be unchanged for what was read from a discovered file to still be valid: its
+    mtime, size and inode (the archive's for an archive entry), () for a git blob, which never
+    changes, or None if the file can't be stat'ed.
+    """
+    if split_blob_path(filepath) is not None:
+        return ()
+    split = split_archive_path(filepath)
+    try:
+        st = os.stat(split[0] if split is not None else filepath)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
@@ -0,0 +1,125 @@
+"""
+Summarizing a git revision straight from the object database (--rev), without checking it out.
+
+tree_blobs lists the .java blobs of the tree of a commit with a single `git ls-tree`.
+A blob is named "path/to/repository@<object id>:path/in/tree" and is handled everywhere else
+like a file path; workers read blobs through one long-running `git cat-file --batch` process
+each instead of one subprocess per file. The object id is a hash of the blob's contents, so
+it doubles as the summary cache key of the blob and unchanged files are never read again.
+
+changed_blobs lists the .java files that differ between two revisions, as pairs of old and
+new blobs, for the API diff (see api_diff.py).
+"""
+import re
+import subprocess
+
+GIT_BLOB = re.compile(r'(.*?)@([0-9a-f]{40}|[0-9a-f]{64}):(.*)', re.DOTALL)
+
+_cat_files = {}
+
+
+class GitError(Exception):
+    pass
+
+
+def split_blob_path(source):
+    """Return (repository root, object id, path in tree) for a git blob, or None for anything else."""
+    match = GIT_BLOB.fullmatch(source)
+    return match.groups() if match else None
+
+
+def tree_blobs(root, prefix, rev):
+    """
+    Return [(blob path, size)] for the .java files under prefix (a path relative to the
+    repository root, ending in '/', or '') in the tree of rev, in tree order.
+    Raises GitError if rev doesn't exist.
+    """
+    try:
+        output = subprocess.run(['git', '-C', root, 'ls-tree', '-r', '-l', '-z', '--full-tree',
+                                 f"{rev}^{{tree}}", '--', prefix or '.'],
+                                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+    except OSError as e:
+        raise GitError(f"cannot run git: {e}")
+    except subprocess.CalledProcessError as e:
+        raise GitError(f"cannot list {rev}: {e.stderr.decode(errors='replace').strip()}")
+
+    blobs = []
+    for line in output.split(b'\0'):
+        if not line:
+            continue
+        info, _, path = line.partition(b'\t')
+        mode, object_type, oid, size = info.split()
+        if object_type != b'blob' or not _java_blob(mode, path):
+            continue
+        path = path.decode('utf-8', 'surrogateescape')
+        blobs.append((f"{root}@{oid.decode()}:{path}", int(size)))
+    return blobs
+
+
+def _java_blob(mode, path):
+    # symlinks are blobs too, holding the link target; submodules are commits
+    return mode not in (b'120000', b'160000') and path.endswith(b'.java')
+
+
+def changed_blobs(root, prefix, old_rev, new_rev):
+    """
+    Return [(path in tree, old blob path or None, new blob path or None)] for the .java files
+    under prefix that were added, deleted or modified between old_rev and new_rev.
+    Raises GitError if either revision doesn't exist.
+    """
+    try:
+        output = subprocess.run(['git', '-C', root, 'diff-tree', '-r', '-z', '--no-renames',
+                                 f"{old_rev}^{{tree}}", f"{new_rev}^{{tree}}", '--', prefix or '.'],
+                                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+    except OSError as e:
+        raise GitError(f"cannot run git: {e}")
+    except subprocess.CalledProcessError as e:
+        raise GitError(f"cannot diff {old_rev} and {new_rev}: {e.stderr.decode(errors='replace').strip()}")
+
+    changes = []
+    fields = output.split(b'\0')
+    for info, path in zip(fields[0::2], fields[1::2]):
+        old_mode, new_mode, old_oid, new_oid, _ = info.lstrip(b':').split()
+        blobs = [None, None]
+        for i, (mode, oid) in enumerate(((old_mode, old_oid), (new_mode, new_oid))):
+            if _java_blob(mode, path) and oid.strip(b'0'):
+                blobs[i] = f"{root}@{oid.decode()}:{path.decode('utf-8', 'surrogateescape')}"
+        if blobs != [None, None]:
+            changes.append((path.decode('utf-8', 'surrogateescape'), *blobs))
+    return changes
+
+
+def blob_sizes(root, blob_paths):
+    """Return [(blob path, size)] for blob_paths, asking git for all sizes at once."""
+    if not blob_paths:
+        return []
+    oids = ''.join(split_blob_path(blob_path)[1] + '\n' for blob_path in blob_paths)
+    output = subprocess.run(['git', '-C', root, 'cat-file', '--batch-check=%(objectsize)'],
+                            input=oids.encode(), check=True, stdout=subprocess.PIPE).stdout
+    return [(blob_path, int(size) if size.isdigit() else 0)
+            for blob_path, size in zip(blob_paths, output.decode().split('\n'))]
+
+
+def _cat_file(root):
+    process = _cat_files.get(root)
+    if process is None or process.poll() is not None:
+        process = subprocess.Popen(['git', '-C', root, 'cat-file', '--batch'],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        _cat_files[root] = process
+    return process
+
+
+def read_blob(root, oid):
+    """Return the contents of blob oid of the repository at root."""
+    process = _cat_file(root)
+    process.stdin.write(oid.encode() + b'\n')
+    process.stdin.flush()
+    header = process.stdout.readline().split()
+    if len(header) < 2:
+        raise GitError(f"git cat-file exited while reading {oid}")
+    if header[1] == b'missing':
+        raise FileNotFoundError(oid)
+    size = int(header[2])
+    data = process.stdout.read(size)
+    process.stdout.read(1)  # newline after the contents
+    return data
@@ -1,92 +1,160 @@
 import argparse
+import bisect
 import concurrent.futures
-import multiprocessing
+import contextlib
 import os
+import signal
 import sys
+import time
 import traceback
 
-from collections import defaultdict
+from collections import Counter, defaultdict, deque, namedtuple
 from functools import partial
 
 from antlr4 import *
+from antlr4.error.Errors import ParseCancellationException
 from tqdm.auto import tqdm
 
+import api_diff
+import decision_profile
+from declarations import FileDeclarations, TextRenderer, type_record, make_renderer, RENDERERS
+from archives import read_source, is_archive, archive_entries, split_archive_path
+from discovery import discover, repository_prefix, git_files, scan_tree, DEFAULT_THREADS
+from git_objects import GitError, split_blob_path, read_blob, changed_blobs, blob_sizes
+from dfa_cache import load_dfa_cache, dfa_state_count, save_worker_snapshot, collect_worker_snapshots
 from JavaLexer import JavaLexer
 from JavaParser import JavaParser
 from JavaParserListener import JavaParserListener
+from run_stats import StatsCollector
+from source_filter import SourceFilter, sniff_package
+from summary_cache import SummaryCache, DEFAULT_MAX_BYTES
+from token_budget import BudgetRenderer
+from watcher import start_watcher
+from worker_files import on_worker_exit
+from worker_profile import start_worker_profiling, profiling, merge_worker_profiles
+
+FileResult = namedtuple('FileResult', ['declarations', 'used_ll', 'cache_hit', 'stats'], defaults=(None,))
+
+
+
+class SignatureOnlyJavaParser(JavaParser):
+    # Rule contexts whose block child is a method, constructor or initializer body.
+    BODY_PARENTS = (
+        JavaParser.MethodBodyContext,
+        JavaParser.ConstructorDeclarationContext,
+        JavaParser.CompactConstructorDeclarationContext,
+        JavaParser.ClassBodyDeclarationContext,
+    )
+
+    def block(self):
+        if not isinstance(self._ctx, self.BODY_PARENTS):
+            return super().block()
+
+        # Skip the body at the token level: the tokens are still attached to the
+        # BlockContext so getText() on enclosing declarations is unchanged, but no
+        # statement/expression subtrees are built.
+        localctx = JavaParser.BlockContext(self, self._ctx, self.state)
+        self.enterRule(localctx, 156, self.RULE_block)
+        try:
+            self.enterOuterAlt(localctx, 1)
+            self.match(JavaParser.LBRACE)
+            depth = 1
+            while True:
+                la = self._input.LA(1)
+                if la == Token.EOF:
+                    self.match(JavaParser.RBRACE)  # reports the missing brace
+                    break
+                if la == JavaParser.LBRACE:
+                    depth += 1
+                elif la == JavaParser.RBRACE:
+                    depth -= 1
+                    if depth == 0:
+                        self.match(JavaParser.RBRACE)
+                        break
+                self.consume()
+        except RecognitionException as re:
+            localctx.exception = re
+            self._errHandler.reportError(self, re)
+            self._errHandler.recover(self, re)
+        finally:
+            self.exitRule()
+        return localctx
+
 
-printed_packages = None
 class JavaSummaryListener(JavaParserListener):
-    def __init__(self, methods_only=False):
+    def __init__(self):
         self.indentation = 0
         self.static_fields = []
         self.fields = []
         self.static_methods = []
         self.methods = []
-        self.methods_only = methods_only
         self.ignore_class = defaultdict(bool)
-        self.file_description = ""  # New variable to store the class description
+        self.package_name = None
+        self.outline = []  # see declarations.FileDeclarations
+        self.types = []  # one declaration record per type, see type_record
+        self.type_stack = []  # (declaration context, record) of the enclosing types
+
+    @property
+    def declarations(self):
+        return FileDeclarations(self.package_name, self.types, self.outline, self.static_fields,
+                                self.static_methods, self.fields, self.methods)
 
     def enterPackageDeclaration(self, ctx):
-        global printed_packages
-        package_name = ctx.qualifiedName().getText()
-        if package_name not in printed_packages:
-            self.file_description += f"# Package {package_name}\n"  # Append to the string instead of printing
-            printed_packages[package_name] = True
+        # the "# Package" header is emitted by main, once per package
+        self.package_name = ctx.qualifiedName().getText()
 
     def enterClassDeclaration(self, ctx):
-        self.ignore_class[self.indentation] = False
         class_name = ctx.identifier().getText()
-        extends_clause = ''
-        implements_clause = ''
-
-        if ctx.EXTENDS():
-            extended = ctx.typeType().getText()
-            if 'Exception' in extended or 'Error' in extended:
-                self.ignore_class[self.indentation] = True
-                return
-            extends_clause = f' extends {extended}'
-
-        if ctx.IMPLEMENTS():
-            istring = ', '.join(I.getText() for I in ctx.typeList())
-            implements_clause = f' implements {istring}'
+        extended = ctx.typeType().getText() if ctx.EXTENDS() else None
+        # typeList(0) is the implements list if there is one; a second one would be "permits"
+        implemented = self.type_names(ctx.typeList(0)) if ctx.IMPLEMENTS() else []
+        ignored = extended is not None and ('Exception' in extended or 'Error' in extended)
+        self.enter_type(ctx, 'class', class_name, [extended] if extended else [], implemented, ignored)
+        self.ignore_class[self.indentation] = ignored
+        if ignored:
+            return
 
-        self.file_description += f"{'  ' * self.indentation}Class {class_name}{extends_clause}{implements_clause}:\n"
+        extends_clause = f' extends {extended}' if extended else ''
+        implements_clause = f" implements {','.join(implemented)}" if implemented else ''
+        self.outline.append((self.indentation, f"Class {class_name}{extends_clause}{implements_clause}:", None))
         self.indentation += 1
 
     def exitClassDeclaration(self, ctx):
+        self.type_stack.pop()
         if not self.ignore_class[self.indentation]:
-            if not self.methods_only:
-                if self.static_fields:
-                    self.file_description += f"{'  ' * self.indentation}Static fields:\n"
-                    for field in self.static_fields:
-                        self.file_description += f"{'  ' * self.indentation}  {field}\n"
-            if self.static_methods:
-                self.file_description += f"{'  ' * self.indentation}Static methods:\n"
-                for method in self.static_methods:
-                    self.file_description += f"{'  ' * self.indentation}  {method}\n"
-            if not self.methods_only:
-                if self.fields:
-                    self.file_description += f"{'  ' * self.indentation}Fields:\n"
-                    for field in self.fields:
-                        self.file_description += f"{'  ' * self.indentation}  {field}\n"
-            if self.methods:
-                self.file_description += f"{'  ' * self.indentation}Methods:\n"
-                for method in self.methods:
-                    self.file_description += f"{'  ' * self.indentation}  {method}\n"
+            counts = (len(self.static_fields), len(self.static_methods), len(self.fields), len(self.methods))
+            self.outline.append((self.indentation, None, counts))
         self.indentation -= 1
 
+    def modifiers(self, ctx):
+        """Keyword modifiers (annotations excluded) of the classBodyDeclaration enclosing ctx"""
+        while ctx is not None and not isinstance(ctx, JavaParser.ClassBodyDeclarationContext):
+            ctx = ctx.parentCtx
+        if ctx is None:
+            return set()
+        keywords = set()
+        for modifier in ctx.modifier():
+            classOrInterfaceModifier = modifier.classOrInterfaceModifier()
+            if classOrInterfaceModifier is None:
+                keywords.add(modifier.getText())
+            elif classOrInterfaceModifier.annotation() is None:
+                keywords.add(classOrInterfaceModifier.getText())
+        return keywords
+
     def enterFieldDeclaration(self, ctx):
         if self.ignore_class[self.indentation]:
             return
         fieldType = ctx.typeType().getText()
+        modifiers = self.modifiers(ctx)
         for varDec in ctx.variableDeclarators().variableDeclarator():
             varName = varDec.variableDeclaratorId().getText()
             if varName not in ['logger']:
-                if 'static' in ctx.getText():
+                if 'static' in modifiers:
                     self.static_fields.append(f"{fieldType} {varName}")
+                    self.add_member(ctx, 'static_fields', f"{fieldType} {varName}", self.visibility(modifiers))
                 else:
                     self.fields.append(f"{fieldType} {varName}")
+                    self.add_member(ctx, 'fields', f"{fieldType} {varName}", self.visibility(modifiers))
 
     def parse_params(self, ctx):
         params = []
@@ -104,11 +172,13 @@ class JavaSummaryListener(JavaParserListener):
             returnType = ctx.typeTypeOrVoid().getText()
             methodName = ctx.identifier().getText()
             params = self.parse_params(ctx)
-            if 'public' in ctx.getText():
-                if 'static' in ctx.getText():
-                    self.static_methods.append(f"{returnType} {methodName}({', '.join(params)})")
-                else:
-                    self.methods.append(f"{returnType} {methodName}({', '.join(params)})")
+            modifiers = self.modifiers(ctx)
+            signature = f"{returnType} {methodName}({', '.join(params)})"
+            # the text lists public methods only; records have all of them, with their visibility
+            if 'public' in modifiers:
+                (self.static_methods if 'static' in modifiers else self.methods).append(signature)
+            self.add_member(ctx, 'static_methods' if 'static' in modifiers else 'methods', signature,
+                            self.visibility(modifiers))
 
     def enterConstructorDeclaration(self, ctx):
         if self.ignore_class[self.indentation]:
@@ -116,48 +186,653 @@ class JavaSummaryListener(JavaParserListener):
         constructorName = ctx.identifier().getText()
         params = self.parse_params(ctx)
         self.methods.append(f"{constructorName}({', '.join(params)})")
+        self.add_member(ctx, 'constructors', f"{constructorName}({', '.join(params)})",
+                        self.visibility(self.modifiers(ctx)))
+
+    # Declaration records (--format json/ndjson). Unlike the text output, they also cover
+    # interfaces, enums and records, and list the members of each type separately.
+
+    # contexts whose body declares members: those of anonymous classes and enum constant
+    # bodies are not recorded
+    MEMBER_OWNERS = (
+        JavaParser.ClassDeclarationContext,
+        JavaParser.InterfaceDeclarationContext,
+        JavaParser.EnumDeclarationContext,
+        JavaParser.RecordDeclarationContext,
+        JavaParser.ClassCreatorRestContext,
+        JavaParser.EnumConstantContext,
+        JavaParser.AnnotationTypeDeclarationContext,
+    )
+
+    @staticmethod
+    def type_names(typeList):
+        return [typeType.getText() for typeType in typeList.typeType()]
+
+    def type_visibility(self, ctx):
+        """
+        The declared visibility of a type: members of interfaces and annotation types are
+        public unless declared private, and local types are private.
+        """
+        parent = ctx.parentCtx
+        if isinstance(parent, JavaParser.TypeDeclarationContext):
+            return self.visibility({modifier.getText() for modifier in parent.classOrInterfaceModifier()
+                                    if modifier.annotation() is None})
+        if isinstance(parent, JavaParser.MemberDeclarationContext):
+            return self.visibility(self.modifiers(ctx))
+        if isinstance(parent, (JavaParser.InterfaceMemberDeclarationContext,
+                               JavaParser.AnnotationTypeElementRestContext)):
+            keywords = {modifier.getText() for modifier in parent.parentCtx.modifier()}
+            return 'private' if 'private' in keywords else 'public'
+        return 'private'
+
+    def enter_type(self, ctx, kind, name, extends, implements, ignored=False):
+        if self.type_stack:
+            name = f"{self.type_stack[-1][1]['name']}.{name}"
+        record = type_record(self.package_name, name, kind, extends, implements, self.type_visibility(ctx))
+        if not ignored:
+            self.types.append(record)
+        self.type_stack.append((ctx, record))
+
+    @staticmethod
+    def visibility(modifiers):
+        return next((keyword for keyword in ('public', 'protected', 'private') if keyword in modifiers), 'package')
+
+    def add_member(self, ctx, kind, signature, visibility='public'):
+        owner = ctx.parentCtx
+        while owner is not None and not isinstance(owner, self.MEMBER_OWNERS):
+            owner = owner.parentCtx
+        if owner is not None and self.type_stack and self.type_stack[-1][0] is owner:
+            record = self.type_stack[-1][1]
+            record[kind].append(signature)
+            if visibility != 'public':
+                record['visibility'][signature] = visibility
+
+    def enterInterfaceDeclaration(self, ctx):
+        self.enter_type(ctx, 'interface', ctx.identifier().getText(),
+                        self.type_names(ctx.typeList(0)) if ctx.EXTENDS() else [], [])
+
+    def exitInterfaceDeclaration(self, ctx):
+        self.type_stack.pop()
+
+    def enterEnumDeclaration(self, ctx):
+        self.enter_type(ctx, 'enum', ctx.identifier().getText(), [],
+                        self.type_names(ctx.typeList()) if ctx.IMPLEMENTS() else [])
+
+    def exitEnumDeclaration(self, ctx):
+        self.type_stack.pop()
+
+    def enterRecordDeclaration(self, ctx):
+        self.enter_type(ctx, 'record', ctx.identifier().getText(), [],
+                        self.type_names(ctx.typeList()) if ctx.IMPLEMENTS() else [])
+
+    def exitRecordDeclaration(self, ctx):
+        self.type_stack.pop()
+
+    def enterRecordComponent(self, ctx):
+        self.add_member(ctx, 'fields', f"{ctx.typeType().getText()} {ctx.identifier().getText()}")
+
+    def enterEnumConstant(self, ctx):
+        enum_name = self.type_stack[-1][1]['name'].rpartition('.')[2]
+        self.add_member(ctx, 'static_fields', f"{enum_name} {ctx.identifier().getText()}")
+
+    def enterConstDeclaration(self, ctx):
+        for constant in ctx.constantDeclarator():
+            self.add_member(ctx, 'static_fields', f"{ctx.typeType().getText()} {constant.identifier().getText()}")
+
+    def enterInterfaceCommonBodyDeclaration(self, ctx):
+        methodName = ctx.identifier().getText()
+        if methodName in ['toString', 'equals', 'hashCode']:
+            return
+        keywords = {modifier.getText() for modifier in ctx.parentCtx.interfaceMethodModifier()}
+        bodyDeclaration = ctx.parentCtx
+        while not isinstance(bodyDeclaration, JavaParser.InterfaceBodyDeclarationContext):
+            bodyDeclaration = bodyDeclaration.parentCtx
+        keywords.update(modifier.getText() for modifier in bodyDeclaration.modifier())
+        signature = f"{ctx.typeTypeOrVoid().getText()} {methodName}({', '.join(self.parse_params(ctx))})"
+        # interface methods are public unless declared private
+        self.add_member(ctx, 'static_methods' if 'static' in keywords else 'methods', signature,
+                        'private' if 'private' in keywords else 'public')
+
+
+def parse_compilation_unit(stream, parser_class=JavaParser):
+    """
+    Parse with SLL prediction and a bail-out error strategy first, and only re-parse
+    with full LL prediction if that fails. Returns (tree, used_ll_fallback).
+    """
+    parser = parser_class(stream)
+    decision_profile.instrument(parser)
+    parser._interp.predictionMode = PredictionMode.SLL
+    parser._errHandler = BailErrorStrategy()
+    parser.removeErrorListeners()
+    try:
+        return parser.compilationUnit(), False
+    except ParseCancellationException:
+        pass
+
+    # the token stream is already filled, so this does not lex the file again
+    stream.seek(0)
+    parser = parser_class(stream)
+    decision_profile.instrument(parser)
+    parser._interp.predictionMode = PredictionMode.LL
+    return parser.compilationUnit(), True
+
+
+def summarize(input_stream, skip_bodies=False, stats=None):
+    """
+    Extract the FileDeclarations of one compilation unit. If stats is a dict, the wall time
+    of each phase (lex, parse, walk) and the number of tokens are added to it; formatting
+    happens where the declarations are rendered, see main.
+    """
+    t0 = time.perf_counter()
+    lexer = JavaLexer(input_stream)
+    stream = CommonTokenStream(lexer)
+    stream.fill()
+    t1 = time.perf_counter()
+    parser_class = SignatureOnlyJavaParser if skip_bodies else JavaParser
+    tree, used_ll = parse_compilation_unit(stream, parser_class)
+    t2 = time.perf_counter()
+
+    walker = ParseTreeWalker()
+    listener = JavaSummaryListener()
+    walker.walk(listener, tree)
+    t3 = time.perf_counter()
 
+    if stats is not None:
+        for phase, elapsed in (('lex', t1 - t0), ('parse', t2 - t1), ('walk', t3 - t2)):
+            stats[phase] = stats.get(phase, 0.0) + elapsed
+        stats['tokens'] = stats.get('tokens', 0) + len(stream.tokens)
+    return FileResult(listener.declarations, used_ll, False)
 
-def process_file(filepath, methods_only, pp):
-    global printed_packages
-    printed_packages = pp
+
+def process_file(filepath, skip_bodies=False, cache=None, collect_stats=False, source_filter=None):
+    """
+    Summarize the file at filepath. Returns a FileResult, or None if the file no longer
+    exists or source_filter excludes its package.
+    """
     try:
-        lexer = JavaLexer(FileStream(filepath, encoding='utf-8'))
-        stream = CommonTokenStream(lexer)
-        parser = JavaParser(stream)
-        tree = parser.compilationUnit()
+        start = time.perf_counter()
+        blob = split_blob_path(filepath)
+        data = None
+        if blob is None or (source_filter is not None and source_filter.needs_package):
+            data = read_blob(*blob[:2]) if blob is not None else read_source(filepath)
+        if source_filter is not None and source_filter.needs_package:
+            if not source_filter.allows(source_filter.relative_path(filepath), sniff_package(data)):
+                return None
+        key = None
+        cached = None
+        if cache is not None:
+            # the object id of a blob already identifies its contents
+            key = cache.blob_key(blob[1], skip_bodies) if blob is not None else cache.key(data, skip_bodies)
+            cached = cache.get(key)
+        if data is None and cached is None:
+            data = read_blob(*blob[:2])
+
+        stats = None
+        if collect_stats:
+            # cache hits on blobs aren't read at all, so count no bytes for them
+            stats = {'path': filepath, 'bytes': len(data) if data is not None else 0, 'tokens': 0,
+                     'read': time.perf_counter() - start, 'lex': 0.0, 'parse': 0.0, 'walk': 0.0, 'format': 0.0}
 
-        walker = ParseTreeWalker()
-        listener = JavaSummaryListener(methods_only=methods_only)
-        walker.walk(listener, tree)
+        if cached is not None:
+            result = FileResult(cached, False, True)
+        else:
+            t0 = time.perf_counter()
+            input_stream = InputStream(data.decode('utf-8'))
+            if stats is not None:
+                stats['read'] += time.perf_counter() - t0
+            result = summarize(input_stream, skip_bodies, stats)
+            if cache is not None:
+                cache.put(key, result.declarations)
 
-        return listener.file_description  # Return the class description here
+        if stats is not None:
+            stats.update(total=time.perf_counter() - start, used_ll=result.used_ll, cache_hit=result.cache_hit)
+            result = result._replace(stats=stats)
+        return result
+    except FileNotFoundError:
+        return None  # deleted since it was discovered (or still in the git index)
     except Exception as e:
         raise Exception(f"Error processing {filepath}: {e}\n{traceback.format_exc()}")
 
-def main(directory, methods_only):
-    files = []
-    for root, dirs, filenames in os.walk(directory):
-        for filename in filenames:
-            if filename.endswith('.java'):
-                files.append(os.path.join(root, filename))
+def process_batch(filepaths, skip_bodies=False, cache=None, collect_stats=False, source_filter=None, cwd=None):
+    """
+    Returns [(filepath, FileResult or None)] for every file of the batch, see process_file.
+    Relative paths are resolved against cwd if given, for workers that serve several callers.
+    """
+    if cwd is not None:
+        os.chdir(cwd)
+    results = []
+    for filepath in filepaths:
+        with profiling():
+            results.append((filepath, process_file(filepath, skip_bodies, cache, collect_stats, source_filter)))
+    return results
 
-    manager = multiprocessing.Manager()
-    global printed_packages
-    printed_packages = manager.dict()  # Create a managed set for printed_packages
 
-    f = partial(process_file, methods_only=methods_only, pp=printed_packages)
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        descriptions = list(tqdm(executor.map(f, files), total=len(files)))
+def make_batches(sized_files, target_bytes=64 * 1024, max_batch_files=64):
+    """
+    Group (path, size) pairs, in order, into contiguous batches of about target_bytes so that
+    each IPC round trip carries several files but a batch holding a large file doesn't straggle.
+    Consumes sized_files lazily, so batches can be dispatched while discovery is still running.
+    """
+    batch, batch_bytes = [], 0
+    for filepath, size in sized_files:
+        if batch and (batch_bytes + size > target_bytes or len(batch) >= max_batch_files):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(filepath)
+        batch_bytes += size
+    if batch:
+        yield batch
 
-    for description in descriptions:
-        print(description)
 
-if __name__ == '__main__':
+def ordered_results(executor, fn, batches, window):
+    """
+    Yield fn(batch) for each batch, in order, as soon as it and all earlier batches are done.
+    At most `window` batches are submitted or waiting to be consumed at any time.
+    """
+    pending = deque()
+    for batch in batches:
+        pending.append(executor.submit(fn, batch))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def init_worker(dfa_cache_path, profile_prefix=None, decision_profile_prefix=None, ignore_interrupts=False):
+    if ignore_interrupts:
+        # Ctrl-C is for the parent, which shuts the pool down cleanly
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if profile_prefix is not None:
+        start_worker_profiling(profile_prefix)
+    if decision_profile_prefix is not None:
+        decision_profile.start_worker_decision_profiling(decision_profile_prefix)
+    if dfa_cache_path is None:
+        return
+    load_dfa_cache(dfa_cache_path)
+    on_worker_exit(save_worker_snapshot, dfa_cache_path, dfa_state_count())
+
+
+def source_name(filepath):
+    """The name of the file a summary comes from, as shown in the output: blobs by their path in the tree."""
+    blob = split_blob_path(filepath)
+    return blob[2] if blob is not None else filepath
+
+
+def main(directory, methods_only, skip_bodies=False, dfa_cache_path=None,
+         cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, out=None, stats=None,
+         profile_prefix=None, decision_profile_prefix=None, discovery_threads=DEFAULT_THREADS,
+         use_git=False, includes=(), excludes=(), include_archives=False, rev=None, output_format='text',
+         executor=None, outputs=(), max_tokens=None):
+    """
+    Summarize every .java file under directory (or in the .jar/.zip archive directory) to out
+    (stdout by default). With include_archives, archives found under directory are read too.
+    With rev, the files under directory in that git revision are summarized instead.
+    If stats is a StatsCollector, per-file statistics are collected by the workers and added to it.
+    output_format 'json' writes a JSON array of type_records instead of the text summary, and
+    'ndjson' one record per line; both are streamed like the text. outputs are more
+    (renderer name, file) pairs to write, all from the same parse (see declarations.RENDERERS).
+    With max_tokens, the text summary is held back until all files are parsed and shortened
+    to fit that many tokens (see token_budget).
+    Files are summarized in a new process pool, or by executor if one is given (then
+    dfa_cache_path and the profiling prefixes are up to whoever started its workers).
+    """
+    out = out or sys.stdout
+    cache = SummaryCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
+    source_filter = SourceFilter(directory, includes, excludes) if includes or excludes else None
+    f = partial(process_batch, skip_bodies=skip_bodies, cache=cache, collect_stats=stats is not None,
+                source_filter=source_filter)
+    workers = os.cpu_count() or 1
+    if max_tokens is not None:
+        renderers = [BudgetRenderer(out, max_tokens, methods_only)]
+    else:
+        renderers = [make_renderer(output_format, out, methods_only)]
+    renderers.extend(make_renderer(name, output) for name, output in outputs)
+    file_count = 0
+    ll_fallbacks = 0
+    cache_hits = 0
+    if executor is None:
+        initargs = (dfa_cache_path, profile_prefix, decision_profile_prefix)
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                      initargs=initargs)
+    else:
+        pool = contextlib.nullcontext(executor)
+    with pool as executor:
+        batches = make_batches(discover(directory, discovery_threads, use_git, source_filter,
+                                        include_archives, rev))
+        with tqdm(unit=' files') as progress:
+            for batch_results in ordered_results(executor, f, batches, window=workers * 4):
+                batch_results = [(filepath, result) for filepath, result in batch_results if result is not None]
+                for filepath, result in batch_results:
+                    t0 = time.perf_counter()
+                    for renderer in renderers:
+                        renderer.write(source_name(filepath), result.declarations)
+                    if result.stats is not None:
+                        # rendering happens here, in the parent, rather than in the worker
+                        elapsed = time.perf_counter() - t0
+                        result.stats['format'] += elapsed
+                        result.stats['total'] += elapsed
+                    file_count += 1
+                    ll_fallbacks += result.used_ll
+                    cache_hits += result.cache_hit
+                    if stats is not None:
+                        stats.add(result.stats)
+                for renderer in renderers:
+                    renderer.out.flush()
+                progress.update(len(batch_results))
+        for renderer in renderers:
+            renderer.close()
+    if dfa_cache_path is not None:
+        collect_worker_snapshots(dfa_cache_path)
+    if profile_prefix is not None:
+        workers_merged = merge_worker_profiles(profile_prefix)
+        print(f"Merged profiles of {workers_merged} workers into {profile_prefix}.pstats and "
+              f"{profile_prefix}.collapsed", file=sys.stderr)
+    if decision_profile_prefix is not None:
+        decision_profile.print_report(decision_profile.merge_worker_decisions(decision_profile_prefix))
+
+    print(f"{ll_fallbacks} of {file_count} files needed full LL prediction", file=sys.stderr)
+
+    if cache is not None:
+        evicted = cache.evict()
+        print(f"Summary cache: {cache_hits} hits, {file_count - cache_hits} misses, {evicted} entries evicted",
+              file=sys.stderr)
+
+    if stats is not None:
+        stats.report()
+
+def api_diff_main(directory, old_rev, new_rev, skip_bodies=False, dfa_cache_path=None,
+                  cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, out=None, includes=(), excludes=()):
+    """
+    Report to out the types and members under directory that were added, removed or changed
+    between git revisions old_rev and new_rev, summarizing only the files that changed.
+    """
+    out = out or sys.stdout
+    repository = repository_prefix(directory)
+    if repository is None:
+        raise GitError(f"{directory} is not inside a git repository")
+    root, _, prefix = repository
+    cache = SummaryCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
+    source_filter = SourceFilter(directory, includes, excludes) if includes or excludes else None
+
+    changes = changed_blobs(root, prefix, old_rev, new_rev)
+    if source_filter is not None:
+        changes = [change for change in changes
+                   if source_filter.allows_path(source_filter.relative_path(change[1] or change[2]))]
+    sources = [blob for _, old_blob, new_blob in changes for blob in (old_blob, new_blob) if blob is not None]
+
+    f = partial(process_batch, skip_bodies=skip_bodies, cache=cache, source_filter=source_filter)
+    workers = os.cpu_count() or 1
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=(dfa_cache_path,)) as executor:
+        for batch_results in ordered_results(executor, f, make_batches(blob_sizes(root, sources)),
+                                             window=workers * 4):
+            results.update(batch_results)
+    if dfa_cache_path is not None:
+        collect_worker_snapshots(dfa_cache_path)
+
+    old_records, new_records = [], []
+    for _, old_blob, new_blob in changes:
+        for blob, records in ((old_blob, old_records), (new_blob, new_records)):
+            result = results.get(blob)
+            if result is not None:
+                records.extend(result.declarations.types)
+    report = api_diff.diff_types(old_records, new_records)
+    api_diff.print_report(report, file=out)
+
+    counts = Counter(change['change'] for change in report)
+    print(f"{len(changes)} files changed, {len(results)} versions summarized: {counts['added']} types added, "
+          f"{counts['removed']} removed, {counts['changed']} changed", file=sys.stderr)
+    if cache is not None:
+        cache.evict()
+
+
+def output_order(filepath):
+    """Sort key putting files in discovery order: the files of a directory, by name, before its subdirectories."""
+    split = split_archive_path(filepath)
+    path, entry = split if split is not None else (filepath, '')
+    *directories, name = path.split(os.sep)
+    return [(1, directory) for directory in directories] + [(0, name, entry)]
+
+
+def changed_sources(paths, known, prune=None, include_archives=False):
+    """
+    The files and archive entries to summarize again for the changed paths reported by a
+    watcher: changed .java files, everything in new directories and archives, and every
+    known file below a removed or changed directory or archive.
+    """
+    sources = set()
+    for path in paths:
+        if path.endswith('.java'):
+            sources.add(path)
+            continue
+        if os.path.isdir(path):
+            sources.update(filepath for filepath, _ in scan_tree(path, prune=prune, include_archives=include_archives))
+        elif include_archives and is_archive(path) and os.path.isfile(path):
+            sources.update(entry for entry, _ in archive_entries(path))
+        sources.update(filepath for filepath in known if filepath.startswith((path + os.sep, path + '!/')))
+    return sources
+
+
+def watch(directory, methods_only, skip_bodies=False, dfa_cache_path=None, cache_dir=None,
+          cache_max_bytes=DEFAULT_MAX_BYTES, output_path=None, discovery_threads=DEFAULT_THREADS,
+          use_git=False, includes=(), excludes=(), include_archives=False, poll_interval=None):
+    """
+    Summarize directory like main, then keep the workers running and summarize files again
+    as they change. With output_path the whole summary is rewritten (atomically) after every
+    change; otherwise the new summary of each changed file is printed to stdout, after an
+    "# Updated path" or "# Removed path" line. Runs until interrupted.
+    """
+    cache = SummaryCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
+    source_filter = SourceFilter(directory, includes, excludes) if includes or excludes else None
+    prune = None
+    if source_filter is not None and source_filter.pruned_directories:
+        prune = lambda path: source_filter.prunes_directory(source_filter.relative_path(path))
+    f = partial(process_batch, skip_bodies=skip_bodies, cache=cache, source_filter=source_filter)
+    workers = os.cpu_count() or 1
+    results = {}
+    keys, ordered = [], []  # output_order keys and paths of the summarized files, in output order
+
+    def update(sized_files):
+        changed = []
+        for batch_results in ordered_results(executor, f, make_batches(sized_files), window=workers * 4):
+            for filepath, result in batch_results:
+                key = output_order(filepath)
+                i = bisect.bisect_left(keys, key)
+                present = i < len(keys) and keys[i] == key
+                if result is not None:
+                    if not present:
+                        keys.insert(i, key)
+                        ordered.insert(i, filepath)
+                    results[filepath] = result
+                elif present:
+                    del keys[i], ordered[i]
+                    del results[filepath]
+                else:
+                    continue
+                changed.append((filepath, result))
+        return changed
+
+    def write_output():
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            renderer = TextRenderer(out, methods_only)
+            for filepath in ordered:
+                renderer.write(filepath, results[filepath].declarations)
+        os.replace(tmp_path, output_path)
+
+    def listed_files():
+        # archive entries can't be stat'ed: poll their archives instead
+        for filepath, _ in discover(directory, discovery_threads, use_git, source_filter, include_archives):
+            split = split_archive_path(filepath)
+            yield split[0] if split is not None else filepath
+
+    # watch first, so that files saved while the initial summary is built aren't missed
+    watcher = start_watcher(directory, listed_files, prune, poll_interval)
+    initargs = (dfa_cache_path, None, None, True)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=initargs) as executor:
+        try:
+            update(discover(directory, discovery_threads, use_git, source_filter, include_archives))
+            if output_path is not None:
+                write_output()
+            else:
+                renderer = TextRenderer(sys.stdout, methods_only)
+                for filepath in ordered:
+                    renderer.write(filepath, results[filepath].declarations)
+                sys.stdout.flush()
+            print(f"Summarized {len(results)} files, watching {directory} for changes", file=sys.stderr)
+
+            while True:
+                sources = changed_sources(watcher.changes(), results, prune, include_archives)
+                start = time.perf_counter()
+                if source_filter is not None:
+                    sources = [source for source in sources
+                               if source_filter.allows_path(source_filter.relative_path(source))]
+                if use_git:
+                    tracked = git_files(directory, include_archives)
+                    if tracked is not None:
+                        tracked = {filepath for filepath, _ in tracked}
+                        sources = [source for source in sources if source in results or source in tracked]
+                changed = update((source, 0) for source in sorted(sources, key=output_order))
+                if not changed:
+                    continue
+                if output_path is not None:
+                    write_output()
+                else:
+                    for filepath, result in changed:
+                        if result is None:
+                            print(f"# Removed {filepath}\n")
+                        else:
+                            print(f"# Updated {filepath}")
+                            TextRenderer(sys.stdout, methods_only).write(filepath, result.declarations)
+                    sys.stdout.flush()
+                print(f"Updated {len(changed)} files in {(time.perf_counter() - start) * 1000:.0f} ms",
+                      file=sys.stderr)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+    if dfa_cache_path is not None:
+        collect_worker_snapshots(dfa_cache_path)
+    if cache is not None:
+        cache.evict()
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description='Process some java files.')
-    parser.add_argument('directory', type=str, help='A directory to scan')
+    parser.add_argument('directory', type=str, help='A directory, or a .jar/.zip archive, to scan')
     parser.add_argument('--methods-only', action='store_true', help='Omit fields from the output')
+    parser.add_argument('--skip-bodies', action='store_true',
+                        help='Skip method, constructor and initializer bodies without parsing them '
+                             '(declarations nested inside bodies are not reported)')
+    parser.add_argument('--dfa-cache', metavar='PATH',
+                        help='Load warmed lexer/parser DFAs from PATH in every worker and save them back after the run')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='Cache per-file summaries in DIR, keyed by file contents, and reuse them on later runs')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='Evict least recently used cache entries beyond this size (default: %(default)s)')
+    parser.add_argument('-o', '--output', metavar='FILE', help='Write the summary to FILE instead of stdout')
+    parser.add_argument('--format', choices=['text', 'json', 'ndjson'], default='text',
+                        help='Write the indented text summary, a JSON array with one record per type, '
+                             'or one JSON record per type and line (default: %(default)s)')
+    parser.add_argument('--write', action='append', default=[], metavar='FORMAT=FILE',
+                        help=f"Also write the summary in FORMAT ({', '.join(RENDERERS)}) to FILE, from the same "
+                             f"parse; may be repeated")
+    parser.add_argument('--max-tokens', type=int, metavar='N',
+                        help='Shorten the text summary to about N tokens (as counted for an LLM prompt), '
+                             'dropping fields, then parameter names, then collapsing packages to class lists')
+    parser.add_argument('--stats', action='store_true',
+                        help='Report per-phase timings, percentiles and the slowest files on stderr')
+    parser.add_argument('--stats-top', type=int, default=10, metavar='N',
+                        help='Number of slowest files to list with --stats (default: %(default)s)')
+    parser.add_argument('--stats-file', metavar='PATH',
+                        help='Write per-file statistics to PATH, as CSV if it ends in .csv and NDJSON otherwise '
+                             '(implies --stats)')
+    parser.add_argument('--profile', metavar='PREFIX',
+                        help='Profile the workers and write the merged results to PREFIX.pstats (cProfile) '
+                             'and PREFIX.collapsed (sampled stacks for flame graphs)')
+    parser.add_argument('--git', action='store_true',
+                        help='List files from the git index plus untracked files that are not ignored, '
+                             'instead of walking the directory (falls back to walking outside a git work tree)')
+    parser.add_argument('--rev', metavar='REV',
+                        help='Summarize the files under the directory as of git revision REV (a commit, branch or tag), '
+                             'reading them from the object database without checking them out')
+    parser.add_argument('--api-diff', nargs=2, metavar=('OLD', 'NEW'),
+                        help='Instead of a summary, report the types and members that were added, removed or '
+                             'changed between git revisions OLD and NEW, parsing only the files that changed')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and summarize files again as they change, rewriting the output file '
+                             '(-o) or printing the new summary of each changed file to stdout')
+    parser.add_argument('--poll-interval', type=float, metavar='SECONDS',
+                        help='With --watch, poll for changes every SECONDS instead of using inotify')
+    parser.add_argument('--archives', action='store_true',
+                        help='Also summarize the .java entries of .jar/.zip files (e.g. -sources.jar) found in the directory')
+    parser.add_argument('--include', action='append', default=[], metavar='PATTERN',
+                        help='Only summarize files matching a path glob (e.g. "src/main/**") or a package '
+                             '(e.g. "com.acme.api.*" for the package and its subpackages); may be repeated')
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help='Skip files matching a path glob (e.g. "src/test/**") or a package; may be repeated')
+    parser.add_argument('--discovery-threads', type=int, default=DEFAULT_THREADS, metavar='N',
+                        help='Number of threads listing directories (default: %(default)s)')
+    parser.add_argument('--decision-profile', metavar='PREFIX',
+                        help='Count invocations, time, lookahead, DFA hits and LL fallbacks per parser decision '
+                             'and write the report to PREFIX.json')
+    return parser
+
+
+def run(args, parser, executor=None):
+    """Run the command line parsed by parser into args. A summary is made by executor if given, see main."""
+    if args.rev is not None and (args.git or args.archives):
+        parser.error('--rev cannot be combined with --git or --archives')
+    if args.api_diff is not None and (args.rev is not None or args.git or args.archives or args.methods_only):
+        parser.error('--api-diff cannot be combined with --rev, --git, --archives or --methods-only')
 
-    args = parser.parse_args()
+    if args.watch and (args.rev is not None or args.api_diff is not None or args.stats or args.stats_file
+                       or args.profile or args.decision_profile):
+        parser.error('--watch cannot be combined with --rev, --api-diff, --stats, --profile or --decision-profile')
+    if (args.format != 'text' or args.write) and (args.watch or args.api_diff is not None):
+        parser.error('--format and --write apply to summaries only, not to --watch or --api-diff')
+    if args.max_tokens is not None and (args.format != 'text' or args.watch or args.api_diff is not None):
+        parser.error('--max-tokens applies to the text summary only, not to --format json/ndjson, '
+                     '--watch or --api-diff')
+    if args.max_tokens is not None and args.max_tokens < 1:
+        parser.error('--max-tokens must be positive')
+    outputs = []
+    for write in args.write:
+        name, _, path = write.partition('=')
+        if name not in RENDERERS or not path:
+            parser.error(f"--write expects FORMAT=FILE with FORMAT one of {', '.join(RENDERERS)}: {write}")
+        outputs.append((name, path))
+    if args.watch:
+        watch(args.directory, args.methods_only, args.skip_bodies, args.dfa_cache, args.cache_dir,
+              args.cache_max_mb * 1024 * 1024, args.output, args.discovery_threads, args.git,
+              args.include, args.exclude, args.archives, args.poll_interval)
+        return
 
-    main(args.directory, args.methods_only)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    stats = StatsCollector(args.stats_top, args.stats_file) if args.stats or args.stats_file else None
+    outputs = [(name, open(path, 'w', encoding='utf-8')) for name, path in outputs]
+    try:
+        if args.api_diff is not None:
+            api_diff_main(args.directory, *args.api_diff, args.skip_bodies, args.dfa_cache, args.cache_dir,
+                          args.cache_max_mb * 1024 * 1024, out, args.include, args.exclude)
+        else:
+            main(args.directory, args.methods_only, args.skip_bodies, args.dfa_cache,
+                 args.cache_dir, args.cache_max_mb * 1024 * 1024, out, stats, args.profile,
+                 args.decision_profile, args.discovery_threads, args.git, args.include, args.exclude,
+                 args.archives, args.rev, args.format, executor, outputs, args.max_tokens)
+    except GitError as e:
+        parser.error(str(e))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        for _, output in outputs:
+            output.close()
+        if stats is not None:
+            stats.close()
+
+
+if __name__ == '__main__':
+    parser = build_parser()
+    run(parser.parse_args(), parser)
@@ -0,0 +1,82 @@
+"""
+Aggregation of the per-file statistics collected by workers in --stats mode.
+
+Each record is a dict with the file path, byte and token counts, the wall time of every
+phase (read, lex, parse, walk, format) and their total. StatsCollector keeps only the
+numbers needed for totals and percentiles plus a top-N heap of the slowest files, and can
+stream the raw records to a CSV or NDJSON file as they arrive.
+"""
+import csv
+import heapq
+import json
+import math
+import sys
+
+PHASES = ['read', 'lex', 'parse', 'walk', 'format']
+FIELDS = ['path', 'bytes', 'tokens'] + PHASES + ['total', 'used_ll', 'cache_hit']
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class StatsCollector:
+    def __init__(self, top=10, dump_path=None):
+        self.top = top
+        self.slowest = []  # min-heap of (total, sequence number, record)
+        self.files = 0
+        self.bytes = 0
+        self.tokens = 0
+        self.phase_times = {phase: [] for phase in PHASES + ['total']}
+        self._dump_file = None
+        self._csv_writer = None
+        if dump_path is not None:
+            self._dump_file = open(dump_path, 'w', newline='', encoding='utf-8')
+            if dump_path.endswith('.csv'):
+                self._csv_writer = csv.DictWriter(self._dump_file, fieldnames=FIELDS)
+                self._csv_writer.writeheader()
+
+    def add(self, record):
+        self.files += 1
+        self.bytes += record['bytes']
+        self.tokens += record['tokens']
+        for phase, times in self.phase_times.items():
+            times.append(record[phase])
+
+        entry = (record['total'], self.files, record)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif self.top:
+            heapq.heappushpop(self.slowest, entry)
+
+        if self._csv_writer is not None:
+            self._csv_writer.writerow(record)
+        elif self._dump_file is not None:
+            self._dump_file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        if self._dump_file is not None:
+            self._dump_file.close()
+            self._dump_file = None
+
+    def report(self, file=sys.stderr):
+        print(f"Stats: {self.files} files, {self.bytes / (1024 * 1024):.2f} MB, {self.tokens} tokens", file=file)
+        grand_total = sum(self.phase_times['total'])
+        print(f"  {'phase':<7}{'total':>10}{'share':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}", file=file)
+        for phase, times in self.phase_times.items():
+            times = sorted(times)
+            total = sum(times)
+            share = total / grand_total * 100 if grand_total else 0.0
+            print(f"  {phase:<7}{total:9.3f}s{share:7.1f}%"
+                  f"{percentile(times, 50) * 1000:8.1f}ms{percentile(times, 90) * 1000:8.1f}ms"
+                  f"{percentile(times, 99) * 1000:8.1f}ms{(times[-1] if times else 0.0) * 1000:8.1f}ms", file=file)
+
+        if self.slowest:
+            print(f"Slowest {len(self.slowest)} files:", file=file)
+            for total, _, record in sorted(self.slowest, reverse=True):
+                print(f"  {total:8.3f}s {record['bytes'] / 1024:8.1f} KB {record['tokens']:8} tokens  {record['path']}",
+                      file=file)
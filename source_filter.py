@@ -0,0 +1,140 @@
+"""
+--include/--exclude filters on the files to summarize.
+
+A pattern is either a path glob or a package pattern. A glob is matched against the path
+relative to the directory being summarized, or, for an archive entry, against its path
+within the archive; '**' matches any number of directories, and a pattern without a '/'
+matches the file name in any directory. A package pattern is a dotted name such as
+com.acme.api, which matches exactly that package, or com.acme.api.*, which also matches
+its subpackages.
+
+Globs are applied during discovery (excluded directories are not even listed). Package
+patterns need the package of the file, which sniff_package reads from the first lines of
+the source without lexing or parsing it.
+"""
+import os
+import re
+
+from archives import split_archive_path
+from git_objects import split_blob_path
+
+PACKAGE_PATTERN = re.compile(r'[A-Za-z_$][\w$]*(\.[A-Za-z_$][\w$]*)+(\.\*)?|[A-Za-z_$][\w$]*\.\*')
+COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+PACKAGE_DECLARATION = re.compile(r'\bpackage\s+([A-Za-z_$][\w$]*(?:\s*\.\s*[A-Za-z_$][\w$]*)*)\s*;')
+TYPE_OR_IMPORT = re.compile(r'\b(import|class|interface|enum|record)\b')
+SNIFF_BYTES = 8192
+# a dotted name whose last part is one of these is a file name (build.gradle, pom.xml), not a package
+FILE_EXTENSIONS = frozenset(['java', 'kt', 'kts', 'groovy', 'scala', 'gradle', 'xml', 'properties', 'json',
+                             'yml', 'yaml', 'toml', 'txt', 'md', 'html', 'jar', 'zip', 'class', 'sql', 'js',
+                             'ts', 'py', 'sh', 'bat', 'cfg', 'conf', 'ini', 'lock', 'csv', 'log', 'bak', 'tmp'])
+
+
+def glob_to_regex(pattern):
+    if '/' not in pattern.rstrip('/'):
+        pattern = '**/' + pattern
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex.append('(?:/.*)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            regex.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            regex.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            regex.append('[^/]')
+            i += 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile(''.join(regex))
+
+
+def is_package_pattern(pattern):
+    """True for com.acme.api or com.acme.api.*, False for globs and file names such as build.gradle."""
+    if not PACKAGE_PATTERN.fullmatch(pattern):
+        return False
+    return pattern.endswith('.*') or pattern.rpartition('.')[2].lower() not in FILE_EXTENSIONS
+
+
+def package_matches(pattern, package):
+    """pattern is a (package name, include subpackages) pair"""
+    name, subpackages = pattern
+    if package is None:
+        return False
+    return package == name or (subpackages and package.startswith(name + '.'))
+
+
+def sniff_package(data):
+    """Return the package declared in the Java source data (bytes), or None for the default package."""
+    for chunk in (data[:SNIFF_BYTES], data) if len(data) > SNIFF_BYTES else (data,):
+        text = COMMENT.sub(' ', chunk.decode('utf-8', 'replace'))
+        declaration = PACKAGE_DECLARATION.search(text)
+        other = TYPE_OR_IMPORT.search(text)
+        if declaration and (other is None or declaration.start() < other.start()):
+            return re.sub(r'\s', '', declaration.group(1))
+        if other is not None:
+            return None
+    return None
+
+
+class SourceFilter:
+    def __init__(self, root, includes=(), excludes=()):
+        self.root = root
+        self.include_globs, self.include_packages = self._split(includes)
+        self.exclude_globs, self.exclude_packages = self._split(excludes)
+        # "dir/**" excludes prune the whole directory during discovery
+        self.pruned_directories = [glob_to_regex(pattern) for pattern in excludes
+                                   if pattern.endswith('/**')]
+
+    @staticmethod
+    def _split(patterns):
+        globs, packages = [], []
+        for pattern in patterns:
+            if is_package_pattern(pattern):
+                packages.append((pattern[:-2], True) if pattern.endswith('.*') else (pattern, False))
+            else:
+                globs.append(glob_to_regex(pattern))
+        return globs, packages
+
+    @property
+    def needs_package(self):
+        return bool(self.include_packages or self.exclude_packages)
+
+    def relative_path(self, filepath):
+        """Path of a file relative to the scanned directory, or of an archive entry within its archive."""
+        split = split_archive_path(filepath)
+        if split is not None:
+            return split[1]
+        blob = split_blob_path(filepath)
+        if blob is not None:
+            root, _, path = blob
+            filepath = os.path.join(root, *path.split('/'))
+        return os.path.relpath(filepath, self.root).replace(os.sep, '/')
+
+    def prunes_directory(self, relative_path):
+        return any(regex.fullmatch(relative_path + '/') for regex in self.pruned_directories)
+
+    def allows_path(self, relative_path):
+        """False if the file is excluded whatever its package is."""
+        if any(regex.fullmatch(relative_path) for regex in self.exclude_globs):
+            return False
+        if self.include_globs and not self.include_packages:
+            return any(regex.fullmatch(relative_path) for regex in self.include_globs)
+        return True
+
+    def allows(self, relative_path, package):
+        if not self.allows_path(relative_path):
+            return False
+        if any(package_matches(pattern, package) for pattern in self.exclude_packages):
+            return False
+        if not (self.include_globs or self.include_packages):
+            return True
+        return (any(regex.fullmatch(relative_path) for regex in self.include_globs)
+                or any(package_matches(pattern, package) for pattern in self.include_packages))
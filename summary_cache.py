@@ -0,0 +1,95 @@
+"""
+On-disk cache of per-file summaries, keyed by the hash of the file contents (or the git
+object id of a blob, which is one), the summarizer/grammar version and the options that
+affect the output.
+
+Entries are small pickle files fanned out into 256 subdirectories. A hit touches the
+entry's mtime, and evict() removes the least recently used entries once the cache
+grows past its size bound.
+"""
+import functools
+import hashlib
+import os
+import pickle
+
+from dfa_cache import grammar_fingerprint
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def tool_fingerprint():
+    h = hashlib.sha256(grammar_fingerprint().encode())
+    # the listener, and the declaration model it fills in, which is what the cache stores
+    for module in ('java_summary_antlr.py', 'declarations.py'):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), module), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, data, *options):
+        h = hashlib.sha256(tool_fingerprint().encode())
+        h.update(repr(options).encode())
+        h.update(data)
+        return h.hexdigest()
+
+    def blob_key(self, oid, *options):
+        return self.key(b'blob ' + oid.encode(), *options)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes. Returns the number removed."""
+        entries = []
+        total = 0
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
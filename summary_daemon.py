@@ -0,0 +1,187 @@
+"""
+Long-lived summary daemon, serving daemon_client.py over a Unix socket.
+
+The daemon imports the parser once and keeps one process pool, so its workers keep their
+warmed-up DFAs from request to request. It also keeps the summaries of the files it has
+seen in memory, keyed by path, --skip-bodies and the file's mtime, size and inode (the
+archive's for an archive entry; blobs of --rev never change), so unchanged files aren't
+even sent to a worker. Requests are served one at a time, in the client's working
+directory, with their output and messages streamed back to the client as they are made.
+"""
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+
+from functools import partial
+
+import daemon_client
+from dfa_cache import collect_worker_snapshots
+from discovery import file_stamp
+from java_summary_antlr import build_parser, run, init_worker
+
+DEFAULT_MAX_ENTRIES = 200000
+# options that need a fresh process, or whose point is measuring a cold run
+IN_PROCESS_OPTIONS = ('watch', 'api_diff', 'stats', 'stats_file', 'profile', 'decision_profile', 'dfa_cache')
+
+
+class MemoizingExecutor:
+    """
+    Stands in for the process pool in main: submit(fn, batch) sends the files of the batch
+    that aren't remembered to the pool and completes with the results of the whole batch.
+    fn is main's partial of process_batch; the workers resolve its paths against the
+    daemon's current directory, which is the client's while a request is served.
+    """
+    def __init__(self, executor, max_entries=DEFAULT_MAX_ENTRIES):
+        self.executor = executor
+        self.max_entries = max_entries
+        self.memory = collections.OrderedDict()  # (path, options) -> (stamp, FileResult), LRU order
+        self.lock = threading.Lock()
+
+    def submit(self, fn, batch):
+        cwd = os.getcwd()
+        fn = partial(fn, cwd=cwd)
+        source_filter = fn.keywords.get('source_filter')
+        if source_filter is not None and source_filter.needs_package:
+            return self.executor.submit(fn, batch)
+        options = fn.keywords['skip_bodies']
+
+        hits = {}
+        stamps = {}
+        with self.lock:
+            for filepath in batch:
+                stamp = file_stamp(filepath)
+                key = (os.path.join(cwd, filepath), options)
+                entry = self.memory.get(key)
+                if stamp is not None and entry is not None and entry[0] == stamp:
+                    self.memory.move_to_end(key)
+                    hits[filepath] = entry[1]._replace(cache_hit=True)
+                else:
+                    stamps[filepath] = stamp
+
+        future = concurrent.futures.Future()
+        if not stamps:
+            future.set_result([(filepath, hits[filepath]) for filepath in batch])
+            return future
+
+        def done(worker_future):
+            try:
+                results = dict(worker_future.result())
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            with self.lock:
+                for filepath, result in results.items():
+                    if result is not None and stamps[filepath] is not None:
+                        key = (os.path.join(cwd, filepath), options)
+                        self.memory[key] = (stamps[filepath], result)
+                        self.memory.move_to_end(key)
+                while len(self.memory) > self.max_entries:
+                    self.memory.popitem(last=False)
+            future.set_result([(filepath, hits[filepath] if filepath in hits else results[filepath])
+                               for filepath in batch])
+
+        self.executor.submit(fn, list(stamps)).add_done_callback(done)
+        return future
+
+
+class FrameWriter(io.TextIOBase):
+    """A text stream sending what is written to the client as frames of one kind."""
+    def __init__(self, connection, kind):
+        self.connection = connection
+        self.kind = kind
+
+    def write(self, text):
+        if text:
+            daemon_client.send_frame(self.connection, self.kind, text.encode('utf-8', 'surrogateescape'))
+        return len(text)
+
+
+def handle(connection, executor, parser):
+    request = json.loads(connection.makefile('rb').readline())
+    stdout = FrameWriter(connection, daemon_client.STDOUT)
+    stderr = FrameWriter(connection, daemon_client.STDERR)
+    status = 0
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            args = parser.parse_args(request['argv'])
+            if any(getattr(args, option) for option in IN_PROCESS_OPTIONS):
+                daemon_client.send_frame(connection, daemon_client.FALLBACK, b'')
+                return
+            # paths are left as given, so that they appear in the output as they would without the daemon
+            os.chdir(request['cwd'])
+            run(args, parser, executor)
+        except SystemExit as e:
+            if isinstance(e.code, str):
+                print(e.code, file=sys.stderr)
+            status = e.code if isinstance(e.code, int) else int(e.code is not None)
+        except BrokenPipeError:
+            return  # the client went away
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    daemon_client.send_frame(connection, daemon_client.EXIT, str(status).encode())
+
+
+def serve(path, dfa_cache_path=None, max_entries=DEFAULT_MAX_ENTRIES):
+    with contextlib.suppress(FileNotFoundError):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with probe:
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.remove(path)  # left behind by a daemon that didn't exit cleanly
+            else:
+                raise SystemExit(f"A daemon is already listening on {path}")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    parser = build_parser()
+    parser.prog = 'java_summary_antlr.py'
+    workers = os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=(dfa_cache_path, None, None, True)) as pool:
+        executor = MemoizingExecutor(pool, max_entries)
+        print(f"Listening on {path}", file=sys.stderr)
+        try:
+            while True:
+                connection, _ = server.accept()
+                with connection:
+                    try:
+                        handle(connection, executor, parser)
+                    except OSError:
+                        pass  # the client went away
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            os.remove(path)
+    if dfa_cache_path is not None:
+        collect_worker_snapshots(dfa_cache_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve java_summary_antlr.py requests from daemon_client.py.')
+    parser.add_argument('--socket', metavar='PATH', default=daemon_client.socket_path(),
+                        help='Unix socket to listen on (default: %(default)s, or $JAVA_SUMMARY_SOCKET)')
+    parser.add_argument('--dfa-cache', metavar='PATH',
+                        help='Load warmed lexer/parser DFAs from PATH at startup and save them back on exit')
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_MAX_ENTRIES, metavar='N',
+                        help='Number of file summaries kept in memory (default: %(default)s)')
+    args = parser.parse_args()
+    # the daemon and its workers change to the directory of each request
+    serve(os.path.abspath(args.socket), args.dfa_cache and os.path.abspath(args.dfa_cache), args.max_entries)
@@ -0,0 +1,293 @@
+"""
+SQLite index of the declarations of a source tree, and lookups in it without parsing.
+
+    python symbol_index.py index path/to/tree          # create or update java-summary.db
+    python symbol_index.py query class Widget          # the summary of a class
+    python symbol_index.py query package com.acme.*    # the types of a package and its subpackages
+    python symbol_index.py query method 'get*'         # the types declaring a method
+
+`index` stores the type records of every file (see declarations.type_record) with the
+file's path, content hash and stamp (mtime, size, inode). On later runs, files with an
+unchanged stamp are skipped without being read, files whose contents hash the same only
+get their stamp updated, and only the rest are parsed; files that are gone are removed.
+The index is rebuilt when the summarizer, the grammar or the options change.
+
+`query` only imports the standard library and declarations.py, so an answer costs a
+Python start and an indexed SQLite lookup. Names may contain * and ? wildcards.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+from declarations import render_type, without_fields
+
+DEFAULT_DB = 'java-summary.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, hash TEXT NOT NULL, stamp TEXT);
+CREATE TABLE IF NOT EXISTS types (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    package TEXT,
+    name TEXT NOT NULL,
+    simple_name TEXT NOT NULL,
+    qualified_name TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS types_path ON types(path);
+CREATE INDEX IF NOT EXISTS types_package ON types(package);
+CREATE INDEX IF NOT EXISTS types_simple_name ON types(simple_name);
+CREATE INDEX IF NOT EXISTS types_qualified_name ON types(qualified_name);
+CREATE TABLE IF NOT EXISTS methods (
+    type_id INTEGER NOT NULL REFERENCES types(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    signature TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS methods_name ON methods(name);
+CREATE INDEX IF NOT EXISTS methods_type_id ON methods(type_id);
+"""
+
+METHOD_SECTIONS = ('static_methods', 'methods', 'constructors')
+
+
+def qualified_name(record):
+    return f"{record['package']}.{record['name']}" if record['package'] else record['name']
+
+
+def method_name(signature):
+    return signature.split('(', 1)[0].split()[-1]
+
+
+class SymbolIndex:
+    def __init__(self, path, create=False):
+        if not create and not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        if create:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def reset(self, version):
+        """Empty the index if it was built with a different version (summarizer, grammar and options)."""
+        if self.meta('version') != version:
+            with self.connection:
+                self.connection.execute('DELETE FROM files')
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+
+    def files(self):
+        """{path: (hash, stamp)} of the indexed files."""
+        return {path: (digest, json.loads(stamp) if stamp is not None else None)
+                for path, digest, stamp in self.connection.execute('SELECT path, hash, stamp FROM files')}
+
+    def set_stamp(self, path, stamp):
+        self.connection.execute('UPDATE files SET stamp = ? WHERE path = ?', (json.dumps(stamp), path))
+
+    def remove(self, path):
+        self.connection.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def put(self, path, digest, stamp, records):
+        """Replace what is indexed for path by the type records of its contents."""
+        self.remove(path)
+        self.connection.execute('INSERT INTO files VALUES (?, ?, ?)',
+                                (path, digest, json.dumps(stamp) if stamp is not None else None))
+        for record in records:
+            type_id = self.connection.execute(
+                'INSERT INTO types (path, package, name, simple_name, qualified_name, record) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (path, record['package'], record['name'], record['name'].rpartition('.')[2],
+                 qualified_name(record), json.dumps(record))).lastrowid
+            self.connection.executemany('INSERT INTO methods VALUES (?, ?, ?)',
+                                        [(type_id, method_name(signature), signature)
+                                         for section in METHOD_SECTIONS for signature in record[section]])
+
+    def types(self, name):
+        """(path, record) of the types whose simple, nested or qualified name matches name."""
+        return [(path, json.loads(record)) for path, record in self.connection.execute(
+            'SELECT path, record FROM types WHERE simple_name GLOB ?1 OR name GLOB ?1 OR qualified_name GLOB ?1 '
+            'ORDER BY qualified_name, path', (name,))]
+
+    def package_types(self, package):
+        """(path, record) of the types of package, and of its subpackages if it ends in .*"""
+        if package.endswith('.*'):
+            query = "package = ?1 OR package GLOB ?1 || '.*'"
+            package = package[:-2]
+        else:
+            query = 'package GLOB ?1'
+        return [(path, json.loads(record)) for path, record in self.connection.execute(
+            f'SELECT path, record FROM types WHERE {query} ORDER BY qualified_name, path', (package,))]
+
+    def methods(self, name):
+        """(path, qualified type name, signature) of the methods and constructors named name."""
+        return self.connection.execute(
+            'SELECT types.path, types.qualified_name, methods.signature FROM methods '
+            'JOIN types ON types.id = methods.type_id WHERE methods.name GLOB ? '
+            'ORDER BY types.qualified_name, methods.signature', (name,)).fetchall()
+
+
+def update_index(db_path, directory, skip_bodies=False, dfa_cache_path=None, discovery_threads=None,
+                 use_git=False, includes=(), excludes=(), include_archives=False):
+    """
+    Bring the index at db_path up to date with the .java files under directory, parsing only
+    the new and changed ones. Returns (files, parsed, unchanged, removed) counts.
+    """
+    # the parser is only needed here, not for queries
+    import concurrent.futures
+    from functools import partial
+
+    from archives import read_source
+    from discovery import discover, file_stamp, DEFAULT_THREADS
+    from java_summary_antlr import process_batch, make_batches, ordered_results, init_worker
+    from dfa_cache import collect_worker_snapshots
+    from source_filter import SourceFilter
+    from summary_cache import tool_fingerprint
+
+    directory = os.path.abspath(directory)
+    source_filter = SourceFilter(directory, includes, excludes) if includes or excludes else None
+    index = SymbolIndex(db_path, create=True)
+    index.reset(json.dumps([tool_fingerprint(), skip_bodies, sorted(includes), sorted(excludes)]))
+    known = index.files()
+
+    seen = set()
+    hashes = {}  # path -> (hash, stamp) of the files to parse
+
+    def changed_files():
+        """(path, size) of the new and changed files, hashed while the workers parse earlier ones."""
+        for path, size in discover(directory, discovery_threads or DEFAULT_THREADS, use_git, source_filter,
+                                   include_archives):
+            seen.add(path)
+            stamp = file_stamp(path)
+            stamp = list(stamp) if stamp is not None else None  # as it reads back from JSON
+            previous = known.get(path)
+            if previous is not None and stamp is not None and previous[1] == stamp:
+                continue
+            try:
+                digest = hashlib.sha256(read_source(path)).hexdigest()
+            except FileNotFoundError:
+                seen.discard(path)
+                continue
+            if previous is not None and previous[0] == digest:
+                index.set_stamp(path, stamp)
+                continue
+            hashes[path] = (digest, stamp)
+            yield path, size
+
+    parsed = 0
+    f = partial(process_batch, skip_bodies=skip_bodies, source_filter=source_filter)
+    workers = os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=(dfa_cache_path,)) as executor:
+        for batch_results in ordered_results(executor, f, make_batches(changed_files()), window=workers * 4):
+            for path, result in batch_results:
+                if result is None:
+                    # deleted since it was hashed, or excluded by its package
+                    seen.discard(path)
+                    continue
+                index.put(path, *hashes.pop(path), result.declarations.types)
+                parsed += 1
+
+    removed = [path for path in known if path not in seen]
+    for path in removed:
+        index.remove(path)
+    if dfa_cache_path is not None:
+        collect_worker_snapshots(dfa_cache_path)
+    index.connection.commit()
+    index.close()
+    return len(seen), parsed, len(seen) - parsed, len(removed)
+
+
+def print_types(matches, methods_only, output_format, out):
+    printed_packages = set()
+    for path, record in matches:
+        if output_format == 'ndjson':
+            record = dict(record, source=path)
+            if methods_only:
+                record = without_fields(record)
+            out.write(json.dumps(record) + '\n')
+            continue
+        if record['package'] is not None and record['package'] not in printed_packages:
+            printed_packages.add(record['package'])
+            out.write(f"# Package {record['package']}\n")
+        out.write(render_type(record, methods_only) + '\n')
+
+
+def query(db_path, kind, name, methods_only=False, output_format='text', out=None):
+    """Print what the index at db_path has for a class, package or method name. Returns the number of matches."""
+    out = out or sys.stdout
+    index = SymbolIndex(db_path)
+    try:
+        if kind == 'method':
+            matches = index.methods(name)
+            for path, type_name, signature in matches:
+                if output_format == 'ndjson':
+                    out.write(json.dumps({'type': type_name, 'signature': signature, 'source': path}) + '\n')
+                else:
+                    out.write(f"{type_name}: {signature}\n")
+        else:
+            matches = index.types(name) if kind == 'class' else index.package_types(name)
+            print_types(matches, methods_only, output_format, out)
+    finally:
+        index.close()
+    return len(matches)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Index the declarations of a Java source tree in SQLite, '
+                                                 'and look up classes, packages and methods in the index.')
+    parser.add_argument('--db', metavar='PATH', default=DEFAULT_DB, help='The index (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = commands.add_parser('index', help='Create the index, or update it with the files that changed')
+    index_parser.add_argument('directory', help='A directory, or a .jar/.zip archive, to index')
+    index_parser.add_argument('--skip-bodies', action='store_true',
+                              help='Skip method bodies without parsing them (see java_summary_antlr.py)')
+    index_parser.add_argument('--dfa-cache', metavar='PATH',
+                              help='Load warmed lexer/parser DFAs from PATH and save them back after the run')
+    index_parser.add_argument('--git', action='store_true',
+                              help='List files from the git index plus untracked files that are not ignored')
+    index_parser.add_argument('--archives', action='store_true',
+                              help='Also index the .java entries of .jar/.zip files found in the directory')
+    index_parser.add_argument('--include', action='append', default=[], metavar='PATTERN',
+                              help='Only index files matching a path glob or a package; may be repeated')
+    index_parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                              help='Skip files matching a path glob or a package; may be repeated')
+    index_parser.add_argument('--discovery-threads', type=int, metavar='N',
+                              help='Number of threads listing directories')
+
+    query_parser = commands.add_parser('query', help='Look up a class, the types of a package, or a method')
+    query_parser.add_argument('kind', choices=['class', 'package', 'method'])
+    query_parser.add_argument('name', help='A simple, nested (Outer.Inner) or qualified class name, a package '
+                                           '(com.acme.* for subpackages too) or a method name; * and ? match any '
+                                           'characters')
+    query_parser.add_argument('--methods-only', action='store_true', help='Omit fields from the output')
+    query_parser.add_argument('--format', choices=['text', 'ndjson'], default='text',
+                              help='Write type summaries as text, or one JSON record per line (default: %(default)s)')
+    return parser
+
+
+if __name__ == '__main__':
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command == 'index':
+        counts = update_index(args.db, args.directory, args.skip_bodies, args.dfa_cache, args.discovery_threads,
+                              args.git, args.include, args.exclude, args.archives)
+        print("Indexed {} files in {}: {} parsed, {} unchanged, {} removed".format(counts[0], args.db, *counts[1:]),
+              file=sys.stderr)
+    else:
+        try:
+            found = query(args.db, args.kind, args.name, args.methods_only, args.format)
+        except FileNotFoundError:
+            parser.error(f"{args.db} does not exist, create it with: {parser.prog} --db {args.db} index DIRECTORY")
+        if not found:
+            print(f"No {args.kind} matches {args.name}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,88 @@
+import os
+import subprocess
+
+import pytest
+
+from discovery import read_git_index, UnsupportedIndex
+
+
+def git(root, *args):
+    return subprocess.run(['git', '-C', str(root), '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                           *args], check=True, stdout=subprocess.PIPE).stdout
+
+
+def write(root, path, text):
+    path = root / path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / 'repo'
+    root.mkdir()
+    git(root, 'init', '-q')
+    # shared path prefixes exercise the prefix compression of version 4
+    for path in ['src/main/java/com/acme/api/Widget.java', 'src/main/java/com/acme/api/WidgetFactory.java',
+                 'src/main/java/com/acme/impl/Circle.java', 'src/test/java/com/acme/WidgetTest.java',
+                 'README.md', 'a' * 120 + '.java']:
+        write(root, path, f'// {path}\n' * (len(path) % 7 + 1))
+    os.symlink('README.md', root / 'link.md')
+    git(root, 'add', '.')
+    git(root, 'commit', '-q', '-m', 'initial')
+    return root
+
+
+def ls_files(root):
+    """(path, size) of the regular files and symlinks in the index that are in the work tree, per git."""
+    entries = []
+    tags = git(root, 'ls-files', '-z', '-t', '-s').split(b'\0')
+    for line in filter(None, tags):
+        tag, mode, _, _, path = line.decode().replace('\t', ' ').split(' ', 4)
+        if tag == 'S' or mode == '160000':  # skip-worktree, submodule
+            continue
+        entries.append((path, os.lstat(root / path).st_size))
+    return sorted(set(entries))
+
+
+@pytest.mark.parametrize('version', [2, 3, 4])
+def test_read_git_index_matches_ls_files(repo, version):
+    git(repo, 'update-index', '--index-version', str(version))
+    assert sorted(read_git_index(repo / '.git')) == ls_files(repo)
+
+
+@pytest.mark.parametrize('version', [3, 4])
+def test_read_git_index_extended_flags(repo, version):
+    # intent-to-add and skip-worktree entries have extended flags
+    write(repo, 'src/main/java/com/acme/api/Added.java', 'class Added {}\n')
+    git(repo, 'add', '-N', 'src/main/java/com/acme/api/Added.java')
+    git(repo, 'update-index', '--skip-worktree', 'src/main/java/com/acme/impl/Circle.java')
+    git(repo, 'update-index', '--index-version', str(version))
+    entries = dict(read_git_index(repo / '.git'))
+    assert 'src/main/java/com/acme/impl/Circle.java' not in entries
+    assert 'src/main/java/com/acme/api/Added.java' in entries
+    # intent-to-add entries are recorded with size 0
+    assert sorted(entries) == [path for path, _ in ls_files(repo)]
+
+
+def test_read_git_index_extensions(repo):
+    # the cache tree extension follows the entries
+    git(repo, 'update-index', '--index-version', '4')
+    git(repo, 'write-tree')
+    assert sorted(read_git_index(repo / '.git')) == ls_files(repo)
+
+
+def test_read_git_index_rejects_split_index(repo):
+    git(repo, 'update-index', '--split-index')
+    with pytest.raises(UnsupportedIndex):
+        read_git_index(repo / '.git')
+
+
+def test_read_git_index_rejects_sha256(tmp_path):
+    root = tmp_path / 'sha256'
+    root.mkdir()
+    git(root, 'init', '-q', '--object-format=sha256')
+    write(root, 'A.java', 'class A {}\n')
+    git(root, 'add', '.')
+    with pytest.raises(UnsupportedIndex):
+        read_git_index(root / '.git')
@@ -0,0 +1,76 @@
+import pytest
+
+from source_filter import SourceFilter, glob_to_regex, is_package_pattern, sniff_package
+
+
+@pytest.mark.parametrize('pattern, path, matches', [
+    ('src/test/**', 'src/test/java/com/acme/WidgetTest.java', True),
+    ('src/test/**', 'src/main/java/com/acme/Widget.java', False),
+    ('src/test/**', 'other/src/test/Widget.java', False),
+    ('*Test.java', 'WidgetTest.java', True),
+    ('*Test.java', 'src/test/java/com/acme/WidgetTest.java', True),
+    ('*Test.java', 'src/main/java/com/acme/Widget.java', False),
+    ('src/*/java/**', 'src/main/java/com/acme/Widget.java', True),
+    ('src/*/java/**', 'src/main/resources/java/Widget.java', False),
+    ('src/main/java/com/acme/Widget?.java', 'src/main/java/com/acme/Widget2.java', True),
+])
+def test_glob_to_regex(pattern, path, matches):
+    assert bool(glob_to_regex(pattern).fullmatch(path)) == matches
+
+
+@pytest.mark.parametrize('pattern, is_package', [
+    ('com.acme.api', True),
+    ('com.acme.api.*', True),
+    ('acme.*', True),
+    ('src/test/**', False),
+    ('*Test.java', False),
+    ('Widget.java', False),
+    ('build.gradle', False),
+    ('pom.xml', False),
+    ('settings.gradle.kts', False),
+    ('com.acme.java.*', True),
+])
+def test_is_package_pattern(pattern, is_package):
+    assert is_package_pattern(pattern) == is_package
+
+
+@pytest.mark.parametrize('patterns, path, package, allowed', [
+    (['com.acme.api'], 'src/A.java', 'com.acme.api', True),
+    (['com.acme.api'], 'src/A.java', 'com.acme.api.internal', False),
+    (['com.acme.api.*'], 'src/A.java', 'com.acme.api.internal', True),
+    (['com.acme.api.*'], 'src/A.java', 'com.acme', False),
+    (['com.acme.api'], 'src/A.java', None, False),
+    (['src/main/**'], 'src/main/A.java', None, True),
+    (['src/main/**', 'com.acme.api'], 'src/test/A.java', 'com.acme.api', True),
+])
+def test_includes(tmp_path, patterns, path, package, allowed):
+    assert SourceFilter(str(tmp_path), includes=patterns).allows(path, package) == allowed
+
+
+@pytest.mark.parametrize('patterns, path, package, allowed', [
+    (['src/test/**'], 'src/test/java/ATest.java', 'com.acme', False),
+    (['src/test/**'], 'src/main/java/A.java', 'com.acme', True),
+    (['*Test.java'], 'src/main/java/ATest.java', 'com.acme', False),
+    (['com.acme.api.*'], 'src/A.java', 'com.acme.api.v2', False),
+    (['com.acme.api.*'], 'src/A.java', 'com.acme.impl', True),
+    (['build.gradle'], 'build.gradle', None, False),
+])
+def test_excludes(tmp_path, patterns, path, package, allowed):
+    assert SourceFilter(str(tmp_path), excludes=patterns).allows(path, package) == allowed
+
+
+def test_exclude_prunes_directories(tmp_path):
+    source_filter = SourceFilter(str(tmp_path), excludes=['src/test/**', 'com.acme.*'])
+    assert source_filter.prunes_directory('src/test')
+    assert not source_filter.prunes_directory('src/main')
+    assert source_filter.needs_package
+
+
+@pytest.mark.parametrize('source, package', [
+    (b'package com.acme.api;\nclass A {}', 'com.acme.api'),
+    (b'/* package com.fake; */\n// package com.fake;\npackage com . acme ;\nclass A {}', 'com.acme'),
+    (b'import java.util.List;\nclass A {}', None),
+    (b'class A { String s = "package com.fake;"; }', None),
+])
+def test_sniff_package(source, package):
+    assert sniff_package(source) == package
@@ -0,0 +1,135 @@
+"""
+Fitting the text summary into a token budget (--max-tokens).
+
+estimate_tokens approximates what an LLM tokenizer makes of the summary without loading
+one: words are split into chunks of up to 8 letters (identifiers like
+"createWidgetFactory" are several tokens), and every punctuation character is a token.
+
+BudgetRenderer collects the declarations of all files, then degrades the summary one
+package at a time until it fits, in stages:
+
+  1. fields are dropped (as with --methods-only),
+  2. parameter names are dropped from signatures,
+  3. the package is collapsed to the list of its classes,
+  4. the package is left out.
+
+Within a stage the package with the largest estimate goes first, ties broken by name, so
+the result only depends on the input. The summary ends with a note of what was elided,
+which is also reported on stderr.
+"""
+import re
+import sys
+
+from declarations import render_text
+
+TOKEN = re.compile(r'[A-Za-z]{1,8}|\d{1,3}|[^\sA-Za-z\d]')
+CLASS_NAME = re.compile(r'Class (\S+?)(?: extends | implements |:)')
+
+FULL, NO_FIELDS, NO_PARAMETER_NAMES, CLASS_LIST, OMITTED = range(5)
+STAGE_NAMES = ['', 'fields dropped', 'parameter names dropped', 'collapsed to class lists', 'omitted']
+
+
+def estimate_tokens(text):
+    return len(TOKEN.findall(text))
+
+
+def strip_parameter_names(signature):
+    """'void put(String key, int value)' -> 'void put(String, int)' (types never contain spaces)"""
+    head, paren, parameters = signature.partition('(')
+    if not paren or parameters == ')':
+        return signature
+    types = [parameter.rpartition(' ')[0] or parameter for parameter in parameters[:-1].split(', ')]
+    return f"{head}({', '.join(types)})"
+
+
+def class_names(declarations):
+    """Names of the classes in the text summary of a file, qualified by their enclosing classes."""
+    enclosing = []
+    names = []
+    for indentation, header, _ in declarations.outline:
+        if header is not None:
+            enclosing[indentation:] = [CLASS_NAME.match(header).group(1)]
+            names.append('.'.join(enclosing))
+    return names
+
+
+def render_file(declarations, level):
+    if level == FULL:
+        return render_text(declarations)
+    if level == NO_FIELDS:
+        return render_text(declarations, methods_only=True)
+    return render_text(declarations._replace(static_methods=[strip_parameter_names(method) for method in
+                                                             declarations.static_methods],
+                                             methods=[strip_parameter_names(method) for method in
+                                                      declarations.methods]), methods_only=True)
+
+
+class BudgetRenderer:
+    def __init__(self, out, max_tokens, methods_only=False):
+        self.out = out
+        self.max_tokens = max_tokens
+        self.start_level = NO_FIELDS if methods_only else FULL
+        self.files = []  # (package name, declarations), in output order
+
+    def write(self, source, declarations):
+        self.files.append((declarations.package_name, declarations))
+
+    def _package_texts(self, level):
+        """{package: [text of each file]} at level; a class list is the text of the first file."""
+        texts = {}
+        for package_name, declarations in self.files:
+            texts.setdefault(package_name, [])
+            if level < CLASS_LIST:
+                texts[package_name].append(render_file(declarations, level) + '\n')
+        if level == CLASS_LIST:
+            for package_name in texts:
+                names = [name for package, declarations in self.files if package == package_name
+                         for name in class_names(declarations)]
+                texts[package_name] = [f"Classes: {', '.join(names)}\n\n"]
+        for package_name, package_texts in texts.items():
+            if package_name is not None and package_texts:
+                package_texts[0] = f"# Package {package_name}\n" + package_texts[0]
+        return texts
+
+    def _note(self, levels, total, full_total):
+        """The note ending a shortened summary, or '' if nothing was elided."""
+        counts = [sum(1 for level in levels.values() if level == stage) for stage in range(OMITTED + 1)]
+        elided = ', '.join(f"{counts[stage]} package{'s' if counts[stage] != 1 else ''} {STAGE_NAMES[stage]}"
+                           for stage in range(self.start_level + 1, OMITTED + 1) if counts[stage])
+        if not elided:
+            return ''
+        return f"# Shortened to fit {self.max_tokens} tokens ({total} of {full_total} estimated): {elided}\n"
+
+    def close(self):
+        stages = range(self.start_level, OMITTED)
+        texts = {level: self._package_texts(level) for level in stages}
+        costs = {level: {package: sum(map(estimate_tokens, package_texts))
+                         for package, package_texts in texts[level].items()} for level in stages}
+        levels = dict.fromkeys(costs[self.start_level], self.start_level)
+        full_total = total = sum(costs[self.start_level].values())
+
+        def fits():
+            # the note is part of the output, so its cost counts against the budget
+            return total + estimate_tokens(self._note(levels, total, full_total)) <= self.max_tokens
+
+        for stage in range(self.start_level + 1, OMITTED + 1):
+            order = sorted(levels, key=lambda package: (-costs[levels[package]][package], package or ''))
+            for package in order:
+                if fits():
+                    break
+                new_cost = costs[stage][package] if stage < OMITTED else 0
+                total -= costs[levels[package]][package] - new_cost
+                levels[package] = stage
+
+        remaining = {package: iter(texts[level][package] if level < OMITTED else ())
+                     for package, level in levels.items()}
+        for package_name, _ in self.files:
+            text = next(remaining[package_name], None)
+            if text is not None:
+                self.out.write(text)
+
+        note = self._note(levels, total, full_total)
+        self.out.write(note)
+        used = total + estimate_tokens(note)
+        print(f"Token budget: {used} of {self.max_tokens} tokens used, {full_total} for the full summary"
+              + (f"; {note[note.index('): ') + 3:].rstrip()}" if note else ''), file=sys.stderr)
@@ -0,0 +1,154 @@
+"""
+Watching a source tree for changes (--watch).
+
+InotifyWatcher uses Linux inotify through ctypes, with a watch on every directory of the
+tree (new directories are watched as they appear). PollingWatcher is the fallback for other
+platforms, exhausted inotify limits and file systems where inotify doesn't see remote
+changes: it compares the mtime and size of every listed file at a fixed interval.
+
+Both have a changes() method that blocks until something changed and returns the set of
+changed paths. Paths may be directories, which means anything below them may have changed
+(a directory was created, moved or deleted, or the event queue overflowed).
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+DEBOUNCE = 0.02
+DEFAULT_POLL_INTERVAL = 1.0
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    def __init__(self, directory, prune=None):
+        """Raises OSError if inotify isn't available or the tree has more directories than it can watch."""
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            inotify_init1 = libc.inotify_init1
+        except AttributeError:
+            raise OSError('inotify is not available')
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directory = directory
+        self.prune = prune
+        self.watches = {}  # watch descriptor -> directory
+        try:
+            self._watch_tree(directory)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _watch_tree(self, directory):
+        for root, dirnames, _ in os.walk(directory):
+            wd = self._add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if root == directory or error == 28:  # ENOSPC: out of watches
+                    raise OSError(error, f"cannot watch {root}: {os.strerror(error)}")
+                continue  # removed in the meantime
+            self.watches[wd] = root
+            dirnames[:] = sorted(name for name in dirnames
+                                 if not (self.prune and self.prune(os.path.join(root, name))))
+
+    def _read_events(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.add(self.directory)
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                parent = self.watches.get(wd)
+                if parent is None or not name:
+                    continue
+                path = os.path.join(parent, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if self.prune and self.prune(path):
+                        continue
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self._watch_tree(path)
+                        except OSError:
+                            pass  # out of watches: changes below path are missed until restart
+                changed.add(path)
+
+    def changes(self):
+        select.select([self.fd], [], [])
+        changed = self._read_events()
+        # an editor's save is usually several events (write, rename, chmod): collect them all
+        while select.select([self.fd], [], [], DEBOUNCE)[0]:
+            changed |= self._read_events()
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    def __init__(self, list_files, interval=DEFAULT_POLL_INTERVAL):
+        """list_files() returns the paths of the files to watch."""
+        self.list_files = list_files
+        self.interval = interval
+        self.state = self._snapshot()
+
+    def _snapshot(self):
+        state = {}
+        for path in self.list_files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def changes(self):
+        while True:
+            time.sleep(self.interval)
+            state = self._snapshot()
+            changed = {path for path in state.keys() | self.state.keys() if state.get(path) != self.state.get(path)}
+            self.state = state
+            if changed:
+                return changed
+
+    def close(self):
+        pass
+
+
+def start_watcher(directory, list_files, prune=None, poll_interval=None):
+    """An InotifyWatcher, or a PollingWatcher if poll_interval is given or inotify can't be used."""
+    if poll_interval is None and os.path.isdir(directory):
+        try:
+            return InotifyWatcher(directory, prune)
+        except OSError:
+            poll_interval = DEFAULT_POLL_INTERVAL
+    return PollingWatcher(list_files, poll_interval)
@@ -0,0 +1,28 @@
+"""
+Per-worker result files, for the data that ProcessPoolExecutor workers accumulate over a
+run (DFA snapshots, profiles, decision tables) and the parent merges at the end.
+
+A worker registers a function with on_worker_exit that writes worker_file(prefix, suffix),
+i.e. PREFIX.worker-<pid>SUFFIX, and the parent lists them with worker_files, merges them
+and removes them.
+"""
+import glob
+import multiprocessing.util
+import os
+
+
+def on_worker_exit(fn, *args):
+    """Call fn(*args) when this worker process exits."""
+    # ProcessPoolExecutor workers exit through multiprocessing, which runs Finalize callbacks
+    # but not atexit handlers
+    multiprocessing.util.Finalize(None, fn, args=args, exitpriority=10)
+
+
+def worker_file(prefix, suffix=''):
+    """The file of this worker for prefix and suffix."""
+    return f"{prefix}.worker-{os.getpid()}{suffix}"
+
+
+def worker_files(prefix, suffix=''):
+    """The files written by all workers for prefix and suffix, sorted."""
+    return sorted(glob.glob(glob.escape(prefix) + '.worker-*' + glob.escape(suffix)))
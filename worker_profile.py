@@ -0,0 +1,103 @@
+"""
+Profiling of the work done inside ProcessPoolExecutor workers (--profile).
+
+Each worker runs cProfile and a sampling thread that records the main thread's stack
+while a file is being processed. When the worker exits it writes
+PREFIX.worker-<pid>.pstats and PREFIX.worker-<pid>.collapsed, and the parent merges them
+into PREFIX.pstats and PREFIX.collapsed (one "frame;frame;frame count" line per stack,
+the input format of flamegraph.pl, speedscope and similar tools).
+"""
+import cProfile
+import collections
+import contextlib
+import os
+import pstats
+import sys
+import threading
+import time
+
+from worker_files import on_worker_exit, worker_file, worker_files
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+_profiler = None
+_sampler = None
+
+
+class StackSampler:
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.active = False
+        self._thread_id = threading.main_thread().ident
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.active:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+
+def start_worker_profiling(prefix, interval=DEFAULT_SAMPLE_INTERVAL):
+    global _profiler, _sampler
+    _profiler = cProfile.Profile()
+    _sampler = StackSampler(interval)
+    on_worker_exit(save_worker_profile, prefix)
+
+
+@contextlib.contextmanager
+def profiling():
+    """Profile the body of the with statement if this worker was started with profiling."""
+    if _profiler is None:
+        yield
+        return
+    _sampler.active = True
+    _profiler.enable()
+    try:
+        yield
+    finally:
+        _profiler.disable()
+        _sampler.active = False
+
+
+def save_worker_profile(prefix):
+    _profiler.dump_stats(worker_file(prefix, '.pstats'))
+    with open(worker_file(prefix, '.collapsed'), 'w', encoding='utf-8') as f:
+        for stack, count in _sampler.counts.items():
+            f.write(f"{stack} {count}\n")
+
+
+def merge_worker_profiles(prefix):
+    """Merge and remove the per-worker profiles. Returns the number of workers merged."""
+    pstats_files = worker_files(prefix, '.pstats')
+    collapsed_files = worker_files(prefix, '.collapsed')
+
+    if pstats_files:
+        merged = pstats.Stats(pstats_files[0])
+        if len(pstats_files) > 1:
+            merged.add(*pstats_files[1:])
+        merged.dump_stats(f"{prefix}.pstats")
+
+    counts = collections.Counter()
+    for path in collapsed_files:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                counts[stack] += int(count)
+    with open(f"{prefix}.collapsed", 'w', encoding='utf-8') as f:
+        for stack, count in sorted(counts.items()):
+            f.write(f"{stack} {count}\n")
+
+    for path in pstats_files + collapsed_files:
+        os.remove(path)
+    return len(pstats_files)